@@ -0,0 +1,337 @@
+from datetime import date
+from functools import wraps
+
+from flask import Blueprint, current_app, request, session
+from sqlalchemy import select
+
+from models import db, User, Section, Book, BookContent, BookIssue, BookRequest
+from search import search_book_ids
+from instrumentation import query_budget
+from engines import read_only
+from caching import conditional
+from users import current_user
+from loans import decide_requests
+from recommendations import similar_books, picks_for
+from routes import check_return_and_revoke
+
+
+# Versioned JSON API, for the kiosk and mobile clients.
+#
+# Clients log in with POST /api/v1/login and then send the session cookie like
+# a browser. Lists are paginated with cursors: a page is
+# {"data": [...], "next": cursor or null}, and the next page is fetched by
+# passing the cursor back as ?after=. For plain lists the cursor is the last id
+# shown (keyset, as in catalog.py); for search hits it is the number of hits
+# seen so far. ?limit= sets the page size, up to MAX_LIMIT.
+#
+# ?fields=id,name,... picks the fields of every item, and only those columns
+# are queried. Book texts are only sent as the "content" field of a book when
+# asked for. Dates are ISO 8601 strings. Responses are compact JSON and carry
+# the same ETags as the HTML pages built from the same data (see caching.py).
+#
+# The read endpoints are plain functions of a connection, the query arguments
+# and the user, registered with @read_page, so asgi.py can serve them on an
+# async engine without going through Flask.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_LIMIT = 100
+
+SECTION_FIELDS = {
+    'id': Section.id, 'name': Section.name, 'date_created': Section.date_created,
+    'description': Section.description, 'book_count': Section.book_count,
+}
+BOOK_FIELDS = {
+    'id': Book.id, 'section_id': Book.section_id, 'name': Book.name, 'authors': Book.authors,
+    'date_added': Book.date_added, 'price': Book.price, 'times_issued': Book.times_issued,
+    'content': BookContent.body,
+}
+REQUEST_FIELDS = {
+    'id': BookRequest.id, 'user_id': BookRequest.user_id, 'user_name': BookRequest.user_name,
+    'book_id': BookRequest.book_id, 'book_name': BookRequest.book_name, 'request_date': BookRequest.request_date,
+    'return_date': BookRequest.return_date, 'status': BookRequest.status,
+}
+LOAN_FIELDS = {
+    'id': BookIssue.id, 'user_id': BookIssue.user_id, 'user_name': BookIssue.user_name,
+    'book_id': BookIssue.book_id, 'book_name': BookIssue.book_name, 'book_author': BookIssue.book_author,
+    'issue_date': BookIssue.issue_date, 'return_date': BookIssue.return_date, 'due_date': BookIssue.due_date,
+    'approved': BookIssue.approved, 'feedback': BookIssue.feedback,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return {'error': str(error)}, error.status
+
+
+def api_login_required(func):
+    @wraps(func)
+    def check(*args, **kwargs):
+        if current_user() is None:
+            raise ApiError(401, 'Login required')
+        return func(*args, **kwargs)
+    return check
+
+
+def api_admin_required(func):
+    @wraps(func)
+    def check(*args, **kwargs):
+        user = current_user()
+        if user is None:
+            raise ApiError(401, 'Login required')
+        if not user.is_admin:
+            raise ApiError(403, 'Admins only')
+        return func(*args, **kwargs)
+    return check
+
+
+def requested_fields(columns, args, default_exclude=('content',)):
+    # The fields named in ?fields=, or all but the expensive ones; id is always included
+    names = args.get('fields')
+    if not names:
+        return [name for name in columns if name not in default_exclude]
+    names = ['id'] + [name for name in dict.fromkeys(names.split(',')) if name and name != 'id']
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ApiError(400, f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def json_object():
+    # The request's JSON body, which must be an object
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Expected a JSON object')
+    return data
+
+
+def page_limit(args):
+    limit = args.get('limit', current_app.config['CATALOG_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def serialize(names, row):
+    return {name: value.isoformat() if isinstance(value, date) else value for name, value in zip(names, row)}
+
+
+def select_fields(columns, names):
+    query = select(*(columns[name] for name in names))
+    if 'content' in names:
+        query = query.join(BookContent, BookContent.id == Book.content_id)
+    return query
+
+
+def books_by_id(conn, names, ids):
+    # The books with these ids, in the same order
+    rows = conn.execute(select_fields(BOOK_FIELDS, names).where(Book.id.in_(ids))).all() if ids else []
+    books = {row.id: serialize(names, row) for row in rows}
+    return [books[id] for id in ids if id in books]
+
+
+def keyset_page(conn, args, columns, names, query):
+    # One page of `query` (which selects `names`) after ?after=, ordered by id
+    limit = page_limit(args)
+    key = columns['id']
+    after = args.get('after', type=int)
+    if after:
+        query = query.where(key > after)
+    rows = conn.execute(query.order_by(key).limit(limit + 1)).all()
+    items = [serialize(names, row) for row in rows[:limit]]
+    return {'data': items, 'next': items[-1]['id'] if len(rows) > limit else None}
+
+
+# The read endpoints. Each takes a connection (db.session here, an async
+# connection's sync facade in asgi.py), the query arguments, the logged-in
+# user and the URL arguments, and returns the response body.
+
+def sections_page(conn, args, user):
+    names = requested_fields(SECTION_FIELDS, args)
+    return keyset_page(conn, args, SECTION_FIELDS, names, select_fields(SECTION_FIELDS, names))
+
+
+def books_page(conn, args, user):
+    names = requested_fields(BOOK_FIELDS, args)
+    query = select_fields(BOOK_FIELDS, names)
+
+    text = args.get('q')
+    if text:
+        offset = max(args.get('after', 0, type=int), 0)
+        ids, has_more = search_book_ids(text, args.get('params'), offset, page_limit(args), conn=conn)
+        return {'data': books_by_id(conn, names, ids), 'next': offset + len(ids) if has_more else None}
+
+    section_id = args.get('section', type=int)
+    if section_id:
+        query = query.where(Book.section_id == section_id)
+    return keyset_page(conn, args, BOOK_FIELDS, names, query)
+
+
+def book_detail(conn, args, user, id):
+    names = requested_fields(BOOK_FIELDS, args)
+    row = conn.execute(select_fields(BOOK_FIELDS, names).where(Book.id == id)).first()
+    if row is None:
+        raise ApiError(404, 'Book not found')
+    return serialize(names, row)
+
+
+def similar_page(conn, args, user, id):
+    # One page of "readers also borrowed" books, see recommendations.py
+    names = requested_fields(BOOK_FIELDS, args)
+    return {'data': books_by_id(conn, names, similar_books(id, page_limit(args))), 'next': None}
+
+
+def picks_page(conn, args, user):
+    names = requested_fields(BOOK_FIELDS, args)
+    return {'data': books_by_id(conn, names, picks_for(user.id, page_limit(args))), 'next': None}
+
+
+def my_loans_page(conn, args, user):
+    names = requested_fields(LOAN_FIELDS, args)
+    query = select_fields(LOAN_FIELDS, names).where(BookIssue.user_id == user.id)
+    status = args.get('status')
+    if status:
+        query = query.where(BookIssue.approved == status)
+    return keyset_page(conn, args, LOAN_FIELDS, names, query)
+
+
+def my_requests_page(conn, args, user):
+    names = requested_fields(REQUEST_FIELDS, args)
+    query = select_fields(REQUEST_FIELDS, names).where(BookRequest.user_id == user.id)
+    return keyset_page(conn, args, REQUEST_FIELDS, names, query)
+
+
+def admin_requests_page(conn, args, user):
+    names = requested_fields(REQUEST_FIELDS, args)
+    query = select_fields(REQUEST_FIELDS, names).where(BookRequest.status == args.get('status', 'pending'))
+    return keyset_page(conn, args, REQUEST_FIELDS, names, query)
+
+
+def admin_loans_page(conn, args, user):
+    names = requested_fields(LOAN_FIELDS, args)
+    query = select_fields(LOAN_FIELDS, names).where(BookIssue.approved == args.get('status', 'Accepted'))
+    return keyset_page(conn, args, LOAN_FIELDS, names, query)
+
+
+# Endpoint: (page function, admins only, change counter scopes, sweeps overdue loans first)
+READ_PAGES = {}
+
+
+def read_page(page, admin=False, scopes=('catalog',), sweep=False):
+    # Puts a view that returns page(...) behind the login check, the overdue
+    # sweep if the page shows loans, the ETag check of its scopes and the read
+    # engine, and registers it so asgi.py can serve it the same way
+    def decorate(func):
+        READ_PAGES[f'{api.name}.{func.__name__}'] = (page, admin, scopes, sweep)
+        view = conditional(*scopes)(read_only(func))
+        if sweep:
+            view = check_return_and_revoke(view)
+        return (api_admin_required if admin else api_login_required)(view)
+    return decorate
+
+
+@api.route('/login', methods=['POST']) # log in with JSON {"username": ..., "password": ...}
+@query_budget(1)
+def api_login():
+    data = json_object()
+    username, password = data.get('username'), data.get('password')
+    if not isinstance(username, str) or not isinstance(password, str):
+        raise ApiError(400, 'Expected {"username": ..., "password": ...}')
+    user = User.query.filter_by(username=username).first()
+    if not user or user.password != password:
+        raise ApiError(401, 'Invalid username or password')
+    session['user_id'] = user.id
+    return {'id': user.id, 'username': user.username, 'name': user.name, 'is_admin': user.is_admin}
+
+
+@api.route('/logout', methods=['POST']) # end the API session
+@query_budget(0)
+def api_logout():
+    session.pop('user_id', None)
+    return {}
+
+
+@api.route('/sections') # sections of the catalog
+@read_page(sections_page)
+@query_budget(3)
+def api_sections():
+    return sections_page(db.session, request.args, current_user())
+
+
+@api.route('/books') # books, optionally of one ?section=, or ranked hits for ?q= (and ?params= as in the search form)
+@read_page(books_page, scopes=('catalog', 'loans'))
+@query_budget(4)
+def api_books():
+    return books_page(db.session, request.args, current_user())
+
+
+@api.route('/books/<int:id>') # one book; ask for its text with ?fields=...,content
+@read_page(book_detail, scopes=('catalog', 'loans'))
+@query_budget(3)
+def api_book(id):
+    return book_detail(db.session, request.args, current_user(), id)
+
+
+@api.route('/books/<int:id>/similar') # books most borrowed by the readers of this one
+@read_page(similar_page, scopes=('catalog', 'loans', 'recommendations'))
+@query_budget(3)
+def api_similar_books(id):
+    return similar_page(db.session, request.args, current_user(), id)
+
+
+@api.route('/me/picks') # books recommended to the user from their loans
+@read_page(picks_page, scopes=('catalog', 'loans', 'recommendations'))
+@query_budget(3)
+def api_my_picks():
+    return picks_page(db.session, request.args, current_user())
+
+
+@api.route('/me/loans') # the user's loans, optionally with one ?status= (Accepted, Returned, Revoked, Declined)
+@read_page(my_loans_page, scopes=('loans',), sweep=True)
+@query_budget(5)
+def api_my_loans():
+    return my_loans_page(db.session, request.args, current_user())
+
+
+@api.route('/me/requests') # the user's pending book requests
+@read_page(my_requests_page, scopes=('loans',))
+@query_budget(3)
+def api_my_requests():
+    return my_requests_page(db.session, request.args, current_user())
+
+
+@api.route('/admin/requests') # the request queue
+@read_page(admin_requests_page, admin=True, scopes=('loans',))
+@query_budget(3)
+def api_admin_requests():
+    return admin_requests_page(db.session, request.args, current_user())
+
+
+@api.route('/admin/requests', methods=['POST']) # accept or reject requests: {"action": "accept" | "reject", "ids": [...]}
+@api_admin_required
+@check_return_and_revoke
+@query_budget(5)
+def api_admin_requests_post():
+    data = json_object()
+    ids = data.get('ids')
+    if data.get('action') not in ('accept', 'reject') or not isinstance(ids, list) or \
+            not ids or not all(isinstance(id, int) for id in ids):
+        raise ApiError(400, 'Expected {"action": "accept" or "reject", "ids": [request ids]}')
+
+    # One transaction for the whole batch, see loans.py
+    decided = decide_requests(ids, accept=data['action'] == 'accept')
+    accepted, declined = decided['Accepted'], decided['Declined']
+    return {'accepted': accepted, 'declined': declined, 'not_found': len(set(ids)) - accepted - declined}
+
+
+@api.route('/admin/loans') # loans of all users, the active ones unless ?status= says otherwise
+@read_page(admin_loans_page, admin=True, scopes=('loans',), sweep=True)
+@query_budget(5)
+def api_admin_loans():
+    return admin_loans_page(db.session, request.args, current_user())
+
+
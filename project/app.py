@@ -1,15 +1,119 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-
-
-app = Flask(__name__)
-
-app.secret_key='12341234'
-
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///mydatalbm.sqlite3"
-
-
-from routes import *
-
-
-if __name__ == '__main__':
+from flask import Flask
+import os
+
+
+# Application factory.
+#
+# Importing this module does nothing but define create_app(): no database is
+# touched and the routes are only imported when an app is built, so prefork
+# servers can preload it cheaply (gunicorn "app:create_app()"). The schema and
+# the first admin are set up explicitly with "flask --app app init-db".
+
+def create_app(config=None):
+    app = Flask(__name__)
+
+    app.secret_key='12341234'
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI", "sqlite:///mydatalbm.sqlite3")
+
+    # SQLite connection PRAGMAs, "production" (WAL) or "default", and the size of the
+    # read-only connection pool used by @read_only routes, 0 to disable it (see engines.py)
+    app.config["SQLITE_PROFILE"] = os.getenv("SQLITE_PROFILE", "production")
+    app.config["SQLITE_READ_POOL_SIZE"] = int(os.getenv("SQLITE_READ_POOL_SIZE", 10))
+
+    # Seconds between runs of the background overdue sweeper, and days a loan may stay out
+    # past its due date, accruing fines, before it is revoked (see sweeper.py)
+    app.config["OVERDUE_SWEEP_INTERVAL"] = int(os.getenv("OVERDUE_SWEEP_INTERVAL", 3600))
+    app.config["REVOKE_AFTER_DAYS"] = int(os.getenv("REVOKE_AFTER_DAYS", 14))
+
+    # Seconds between runs of the background job that updates the daily rollups (see rollups.py)
+    app.config["ROLLUP_INTERVAL"] = int(os.getenv("ROLLUP_INTERVAL", 300))
+
+    # Fine per overdue day and the most a loan can be fined, as a fraction of the book's price (see fines.py)
+    app.config["FINE_DAILY_RATE"] = int(os.getenv("FINE_DAILY_RATE", 1))
+    app.config["FINE_CAP_RATIO"] = float(os.getenv("FINE_CAP_RATIO", 1.0))
+
+    # Number of hits per page of catalog search results
+    app.config["SEARCH_PAGE_SIZE"] = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+
+    # Sections or books per "load more" page, and book cards shown per section on the catalog pages
+    app.config["CATALOG_PAGE_SIZE"] = int(os.getenv("CATALOG_PAGE_SIZE", 20))
+    app.config["CATALOG_CARDS_PER_SECTION"] = int(os.getenv("CATALOG_CARDS_PER_SECTION", 8))
+
+    # Pending requests per page of the admin's approval queue
+    app.config["REQUEST_PAGE_SIZE"] = int(os.getenv("REQUEST_PAGE_SIZE", 50))
+
+    # Logged-in users kept in the per-process user cache, and seconds before an entry is reloaded (see users.py)
+    app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", 1024))
+    app.config["USER_CACHE_TTL"] = int(os.getenv("USER_CACHE_TTL", 60))
+
+    # Where rendered book PDFs are cached (see pdfs.py)
+    app.config["PDF_CACHE_DIR"] = os.getenv("PDF_CACHE_DIR", os.path.join(app.instance_path, "pdf_cache"))
+
+    # Rendered catalog fragments kept per process, and an optional directory shared by all workers (see fragments.py)
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.getenv("FRAGMENT_CACHE_SIZE", 1024))
+    app.config["FRAGMENT_CACHE_DIR"] = os.getenv("FRAGMENT_CACHE_DIR", "")
+
+    # Similar books kept per book, and seconds between rebuilds of the recommendation index (see recommendations.py)
+    app.config["RECOMMEND_NEIGHBORS"] = int(os.getenv("RECOMMEND_NEIGHBORS", 20))
+    app.config["RECOMMEND_REBUILD_INTERVAL"] = int(os.getenv("RECOMMEND_REBUILD_INTERVAL", 3600))
+
+    # Threads running the Flask routes when served by asgi.py; its async routes need none
+    app.config["ASGI_WSGI_THREADS"] = int(os.getenv("ASGI_WSGI_THREADS", 10))
+
+    # Raise instead of logging a warning when a route runs more queries than its budget (see instrumentation.py)
+    app.config["QUERY_BUDGET_STRICT"] = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+    # Log requests slower than this many milliseconds with their SQL statements, 0 to disable (see metrics.py)
+    app.config["SLOW_REQUEST_MS"] = int(os.getenv("SLOW_REQUEST_MS", 0))
+
+    # Run the overdue sweeper, the rollups and the fine billing in background threads of this process. Leave it
+    # off where cron runs "flask sweep-overdue", "flask rollup" and "flask assess-fines" instead
+    app.config["BACKGROUND_JOBS"] = os.getenv("BACKGROUND_JOBS", "0") == "1"
+
+    # Overrides, e.g. from a benchmark or a test
+    if config:
+        app.config.update(config)
+
+    from models import db
+    from engines import configure_read_bind, tune_engines
+    configure_read_bind(app)
+    db.init_app(app)
+    with app.app_context():
+        tune_engines(db)
+
+    import metrics, engines, instrumentation, users, caching, migrations, stats, sweeper, rollups, fines, importer, \
+        exports
+    for module in (metrics, engines, instrumentation, users, caching, migrations, stats, sweeper, rollups, fines,
+                   importer, exports):
+        module.init_app(app) # request hooks and CLI commands
+
+    from routes import main
+    from api import api
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+
+    if app.config["BACKGROUND_JOBS"]:
+        start_background_jobs(app)
+
+    return app
+
+
+def start_background_jobs(app):
+    from sweeper import start_sweeper
+    from rollups import start_rollups
+    from fines import start_billing
+    start_sweeper(app)
+    start_rollups(app)
+    start_billing(app)
+
+
+if __name__ == '__main__':
+    from migrations import init_db
+    app = create_app({"BACKGROUND_JOBS": False})
+    with app.app_context():
+        init_db()
+    # With the debug reloader only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs(app)
     app.run(debug=True,)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import http_date, parse_cookie, parse_date, parse_etags, quote_etag
+from werkzeug.routing import RequestRedirect
+
+from app import create_app
+from api import READ_PAGES, ApiError
+from caching import page_validators, is_fresh
+from engines import SQLITE_PROFILES, is_sqlite_file, pragma_setter
+from metrics import REQUEST_SECONDS
+from sweeper import sweep_is_due, sweep_if_due
+from users import load_user
+
+
+# Async serving mode (optional: needs uvicorn, aiosqlite and a2wsgi).
+#
+#   uvicorn --factory asgi:create_asgi_app
+#
+# The read endpoints of the JSON API (api.READ_PAGES: catalog, search, book
+# texts, loans and the admin queues) are served on the event loop, with their
+# queries run through an async SQLAlchemy engine on aiosqlite. A request
+# waiting for the database holds no thread, so one process keeps thousands of
+# readers connected while SQLITE_READ_POOL_SIZE connections do the reading.
+# They go through the same page functions, login checks and ETags as under
+# Flask.
+#
+# Everything else is handed to the Flask app unchanged, on a pool of
+# ASGI_WSGI_THREADS threads.
+
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+        self.urls = flask_app.url_map.bind('localhost')
+        self.engine = None
+
+        uri = flask_app.config['SQLALCHEMY_DATABASE_URI']
+        if is_sqlite_file(uri) and flask_app.config['SQLITE_READ_POOL_SIZE'] > 0:
+            # Read-only connections like the "read" bind's, see engines.py
+            self.engine = create_async_engine(make_url(uri).set(drivername='sqlite+aiosqlite'),
+                                              poolclass=AsyncAdaptedQueuePool,
+                                              pool_size=flask_app.config['SQLITE_READ_POOL_SIZE'])
+            pragmas = SQLITE_PROFILES[flask_app.config['SQLITE_PROFILE']]
+            event.listen(self.engine.sync_engine, 'connect', pragma_setter(pragmas, query_only=True))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        endpoint, view_args = self.match(scope)
+        if endpoint in READ_PAGES:
+            return await self.read_page(scope, send, endpoint, view_args)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def match(self, scope):
+        # (endpoint, URL arguments) of a GET the event loop can serve, else (None, None)
+        if self.engine is None or scope['type'] != 'http' or scope['method'] != 'GET':
+            return None, None
+        try:
+            return self.urls.match(scope['path'], method='GET')
+        except (HTTPException, RequestRedirect):
+            return None, None
+
+    def open_session(self, headers):
+        # Flask's session cookie, as SecureCookieSessionInterface reads it
+        app = self.flask_app
+        cookie = parse_cookie(headers.get('cookie', '')).get(app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return {}
+        serializer = app.session_interface.get_signing_serializer(app)
+        try:
+            return serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+    def sweep(self):
+        with self.flask_app.app_context():
+            sweep_if_due()
+
+    async def read_page(self, scope, send, endpoint, view_args):
+        start = time.perf_counter()
+        page, admin, scopes, sweep = READ_PAGES[endpoint]
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        session = self.open_session(headers)
+        query_string = scope['query_string'].decode('latin-1')
+        args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        full_path = f"{scope['path']}?{query_string}"  # as Flask's request.full_path
+
+        def respond(conn):
+            # Runs with a sync facade over the async connection, see
+            # AsyncConnection.run_sync; every query still awaits aiosqlite
+            user_id = session.get('user_id')
+            user = load_user(user_id, conn) if user_id is not None else None
+            if user is None:
+                raise ApiError(401, 'Login required')
+            if admin and not user.is_admin:
+                raise ApiError(403, 'Admins only')
+
+            validators = []
+            if '_flashes' not in session and not self.flask_app.debug:
+                etag, modified = page_validators(scopes, user, full_path, conn)
+                validators = [('etag', quote_etag(etag)), ('last-modified', http_date(modified)),
+                              ('cache-control', 'private, no-cache'), ('vary', 'Cookie')]
+                if is_fresh(etag, modified, parse_etags(headers.get('if-none-match')),
+                            parse_date(headers.get('if-modified-since'))):
+                    return 304, None, validators
+            return 200, page(conn, args, user, **view_args), validators
+
+        if sweep and sweep_is_due():
+            await asyncio.to_thread(self.sweep)
+        with self.flask_app.app_context():
+            try:
+                async with self.engine.connect() as conn:
+                    status, body, extra_headers = await conn.run_sync(respond)
+            except ApiError as error:
+                status, body, extra_headers = error.status, {'error': str(error)}, []
+
+        # The same compact JSON as a Flask response
+        data = b'' if body is None else (self.flask_app.json.dumps(body, separators=(',', ':')) + '\n').encode()
+        response_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())]
+        response_headers += [(name.encode(), value.encode('latin-1')) for name, value in extra_headers]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': data})
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, 'GET', str(status))
+
+
+def create_asgi_app(config=None):
+    return AsyncApp(create_app(config))
@@ -0,0 +1,3 @@
+# Performance benchmarks. Each module is run from the project directory, e.g.
+#   python -m benchmarks.overdue_sweep
+# and runs the app on a scratch database, see library.scratch_app().
@@ -0,0 +1,67 @@
+# The JSON API against the HTML pages that show the same data.
+#
+#   python -m benchmarks.api_vs_html [--scale medium] [--requests 100]
+#
+# Seeds a synthetic library (see library.py) and requests each HTML page and
+# its /api/v1 counterpart as the same user, printing the median latency,
+# queries and response size of both. The HTML admin queues list everything on
+# one page while the API returns pages of --limit items, as a client would
+# fetch them.
+
+import argparse
+import statistics
+import time
+
+from benchmarks.library import SCALES, PASSWORD, seed_library, scratch_app
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+
+def measure(client, url, requests):
+    client.get(url)
+    timings, queries = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(int(response.headers['X-Query-Count']))
+    assert response.status_code == 200, (url, response.status_code)
+    return statistics.median(timings), statistics.mean(queries), len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    with app.app_context():
+        library = seed_library(**SCALES[args.scale])
+        sweep_overdue()
+
+    reader, admin = app.test_client(), app.test_client()
+    reader.post('/login', data={'username': library['usernames'][0], 'password': PASSWORD})
+    admin.post('/login', data={'username': 'admin@bench', 'password': PASSWORD})
+    section = library['section_ids'][0]
+    pairs = [
+        ('section books', reader, f'/index/section/{section}', f'/api/v1/books?section={section}'),
+        ('search', reader, '/index?query=river', '/api/v1/books?q=river'),
+        ('loan history', reader, '/user/book_issue/history', f'/api/v1/me/loans?limit={args.limit}'),
+        ('request queue', admin, '/admin/book_requests', f'/api/v1/admin/requests?limit={args.limit}'),
+        ('active loans', admin, '/admin/book_issued_list', f'/api/v1/admin/loans?limit={args.limit}'),
+    ]
+    for client in (reader, admin):
+        client.get('/index')  # shows the login message, which turns caching off for one request
+
+    print(f'{"":>14} {"HTML ms":>8} {"queries":>8} {"bytes":>9} {"API ms":>8} {"queries":>8} {"bytes":>9}')
+    for name, client, html_url, api_url in pairs:
+        html_ms, html_queries, html_bytes = measure(client, html_url, args.requests)
+        api_ms, api_queries, api_bytes = measure(client, api_url, args.requests)
+        print(f'{name:>14} {html_ms:>8.2f} {html_queries:>8.1f} {html_bytes:>9} '
+              f'{api_ms:>8.2f} {api_queries:>8.1f} {api_bytes:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Concurrent book request approvals.
+#
+#   python -m benchmarks.approval_race [--threads 8] [--readers 20] [--requests-per-reader 12] [--batch 0]
+#
+# Every reader asks for more books than the loan limit allows, and several
+# admin sessions then approve (and now and then reject) all the requests at
+# once, each request clicked by two admins. Afterwards it checks that nobody
+# holds more than MAX_ACTIVE_LOANS books, that every request was decided
+# exactly once and that no request was left behind. Exits 1 if any check fails.
+#
+# With --batch N the admins send N requests at a time to the API's batch
+# endpoint instead of clicking them one by one.
+
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.library import PASSWORD, seed_library, scratch_app
+from loans import MAX_ACTIVE_LOANS
+from models import db, BookRequest, BookIssue
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+
+def admin(clicks, errors, batch):
+    client = app.test_client()
+    if batch:
+        client.post('/api/v1/login', json={'username': 'admin@bench', 'password': PASSWORD})
+        for start in range(0, len(clicks), batch):
+            for action in ('accept', 'reject'):
+                ids = [id for id, act in clicks[start:start + batch] if act == action]
+                if ids:
+                    response = client.post('/api/v1/admin/requests', json={'action': action, 'ids': ids})
+                    if response.status_code != 200:
+                        errors.append(f'{action} {len(ids)} requests: HTTP {response.status_code}')
+        return
+    client.post('/login', data={'username': 'admin@bench', 'password': PASSWORD})
+    for request_id, action in clicks:
+        try:
+            response = client.get(f'/book/request/{action}/{action}ed/{request_id}')
+            if response.status_code != 302:
+                errors.append(f'{action} {request_id}: HTTP {response.status_code}')
+        except Exception as error:
+            errors.append(f'{action} {request_id}: {error!r}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=20)
+    parser.add_argument('--requests-per-reader', type=int, default=12)
+    parser.add_argument('--batch', type=int, default=0)
+    args = parser.parse_args()
+
+    with app.app_context():
+        # Every reader asks for every book
+        request_ids = seed_library(users=args.readers, sections=1, books=args.requests_per_reader,
+                                   requests=args.readers * args.requests_per_reader, issues=0)['request_ids']
+        sweep_overdue()
+
+        clicks = [(id, 'reject' if id % 7 == 0 else 'accept') for id in request_ids] * 2
+        random.shuffle(clicks)
+        errors = []
+        threads = [threading.Thread(target=admin, args=(clicks[i::args.threads], errors, args.batch)) for i in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        db.session.expire_all()
+        active = Counter(name for name, in db.session.query(BookIssue.user_name).filter_by(approved='Accepted'))
+        issues = db.session.query(BookIssue).count()
+        left = db.session.query(BookRequest).count()
+
+        print(f'{len(clicks):,} clicks from {args.threads} admins in {elapsed:.1f} s')
+        print(f'{sum(active.values()):,} loans accepted, {issues - sum(active.values()):,} declined, {left} requests left')
+        print(f'most loans held by one reader: {max(active.values(), default=0)} (limit {MAX_ACTIVE_LOANS})')
+
+        failures = errors[:10]
+        if max(active.values(), default=0) > MAX_ACTIVE_LOANS:
+            failures.append('a reader holds more loans than the limit')
+        if issues != len(request_ids):
+            failures.append(f'{issues} issues for {len(request_ids)} requests')
+        if left:
+            failures.append(f'{left} requests were not decided')
+        for failure in failures:
+            print('FAIL', failure)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Many concurrent API readers against the threaded server and asgi.py.
+#
+#   python -m benchmarks.async_readers [--scale small] [--concurrency 100,1000] [--requests 5]
+#
+# Seeds a synthetic library (see library.py), then serves it from a separate
+# process, first with werkzeug's threaded server (a thread per connection) and
+# then with uvicorn and asgi.py (API reads on the event loop). For every
+# --concurrency level that many readers connect at once and each makes
+# --requests requests to the API read endpoints, one connection per request.
+# Prints throughput, p50/p99 latency and failed requests per server.
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from app import create_app
+from benchmarks.library import SCALES, WORDS, PASSWORD, seed_library, scratch_app
+from sweeper import sweep_overdue
+
+SERVERS = {
+    'threaded': [sys.executable, '-m', 'benchmarks.async_readers', '--serve-threaded'],
+    'asgi': [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_asgi_app', '--log-level', 'warning',
+             '--backlog', '4096', '--no-access-log'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_threaded(port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', port, create_app(), threaded=True, request_handler=QuietHandler)
+    server.socket.listen(4096)
+    server.serve_forever()
+
+
+async def get(port, path, cookie):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def run_readers(port, paths, cookies, concurrency, requests):
+    timings, failures = [], 0
+    start_gate = asyncio.Event()
+
+    async def reader(number):
+        nonlocal failures
+        rng = random.Random(number)
+        await start_gate.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                status = await get(port, rng.choice(paths), cookies[number % len(cookies)])
+            except OSError:
+                status = None
+            if status == 200:
+                timings.append((time.perf_counter() - start) * 1000)
+            else:
+                failures += 1
+
+    tasks = [asyncio.create_task(reader(number)) for number in range(concurrency)]
+    started = time.perf_counter()
+    start_gate.set()
+    await asyncio.gather(*tasks)
+    return timings, failures, time.perf_counter() - started
+
+
+def wait_for(port, process):
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError('server exited')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--concurrency', default='100,1000')
+    parser.add_argument('--requests', type=int, default=5)
+    parser.add_argument('--serve-threaded', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_threaded:
+        return serve_threaded(args.port)
+
+    # The server processes find the seeded database in the environment
+    app = scratch_app()
+    with app.app_context():
+        library = seed_library(**SCALES[args.scale])
+        sweep_overdue()
+
+    cookies = []
+    for username in library['usernames'][:50]:
+        client = app.test_client()
+        client.post('/api/v1/login', json={'username': username, 'password': PASSWORD})
+        cookies.append(f"session={client.get_cookie('session').value}")
+    rng = random.Random(0)
+    paths = ([f'/api/v1/books?section={rng.choice(library["section_ids"])}' for _ in range(20)] +
+             [f'/api/v1/books?q={rng.choice(WORDS)}' for _ in range(20)] +
+             [f'/api/v1/books/{rng.choice(library["book_ids"])}?fields=name,content' for _ in range(20)] +
+             ['/api/v1/me/loans', '/api/v1/me/requests', '/api/v1/sections'] * 5)
+
+    print(f'{"server":>9} {"readers":>8} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>9} {"failed":>7}')
+    for server, command in SERVERS.items():
+        port = free_port()
+        process = subprocess.Popen(command + ['--port', str(port)], env=dict(os.environ, ASGI_WSGI_THREADS='10'))
+        try:
+            wait_for(port, process)
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                timings, failures, elapsed = asyncio.run(run_readers(port, paths, cookies, concurrency, args.requests))
+                timings.sort()
+                p50 = timings[len(timings) // 2] if timings else 0
+                p99 = timings[min(len(timings) - 1, int(0.99 * len(timings)))] if timings else 0
+                print(f'{server:>9} {concurrency:>8} {len(timings) / elapsed:>8.0f} {p50:>8.1f} {p99:>9.1f} {failures:>7}')
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
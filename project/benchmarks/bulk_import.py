@@ -0,0 +1,58 @@
+# Bulk catalog import throughput.
+#
+#   python -m benchmarks.bulk_import [--books 1000000] [--sections 1000] [--batch-size 5000]
+#
+# Writes a CSV catalog of generated books (with a share of repeated texts and a
+# few invalid rows) and times CatalogImport loading it into an empty database.
+
+import argparse
+import csv
+import os
+import time
+
+from benchmarks.library import scratch_app, scratch_dir
+from importer import CatalogImport, read_rows
+from models import db, Book, BookContent
+
+app = scratch_app()
+
+
+def write_catalog(path, books, sections):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['section', 'name', 'authors', 'content', 'price', 'date_added'])
+        for i in range(books):
+            # Every tenth row repeats an earlier text, every thousandth has a bad price
+            content = f'Text of book {i % (books // 10 * 9 or 1)}. ' * 20
+            price = 'free' if i % 1000 == 999 else i % 50
+            writer.writerow([f'Section {i % sections}', f'Book {i}', f'Author {i % 5000}', content, price, '2024-01-01'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--sections', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    path = os.path.join(scratch_dir(), 'catalog.csv')
+    write_catalog(path, args.books, args.sections)
+
+    with app.app_context():
+        start = time.perf_counter()
+        job = CatalogImport(batch_size=args.batch_size).run(read_rows(path))
+        elapsed = time.perf_counter() - start
+
+        print(f'imported {job.imported:,} books ({job.rejected:,} rejected) into {len(job.sections):,} sections')
+        print(f'{elapsed:.1f} s, {job.imported / elapsed:,.0f} books/s')
+        print(f'{Book.query.count():,} books, {BookContent.query.count():,} distinct texts in the database')
+
+        # A second run finds every name already present
+        start = time.perf_counter()
+        again = CatalogImport(batch_size=args.batch_size).run(read_rows(path))
+        print(f're-import: {again.imported:,} imported, {again.rejected:,} rejected in {time.perf_counter() - start:.1f} s')
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Full renders against 304 revalidations of the cached catalog and status pages.
+#
+#   python -m benchmarks.conditional_get [--scale medium] [--requests 200]
+#
+# Seeds a synthetic library (see library.py), then requests every page first
+# without and then with the ETag of its last response, as a browser does on a
+# repeat visit, and prints the median latency and queries of both.
+
+import argparse
+import statistics
+import time
+
+from benchmarks.library import SCALES, PASSWORD, seed_library, scratch_app
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+
+def measure(client, url, requests, etag=None):
+    timings, queries = [], []
+    headers = {'If-None-Match': etag} if etag else {}
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(int(response.headers['X-Query-Count']))
+    return response, statistics.median(timings), statistics.mean(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        library = seed_library(**SCALES[args.scale])
+        sweep_overdue()
+
+    reader, admin = app.test_client(), app.test_client()
+    reader.post('/login', data={'username': library['usernames'][0], 'password': PASSWORD})
+    admin.post('/login', data={'username': 'admin@bench', 'password': PASSWORD})
+    section, book = library['section_ids'][0], library['book_ids'][0]
+    pages = [(reader, '/index'), (reader, '/index?query=river'), (reader, f'/index/section/{section}'),
+             (admin, '/book/all_book'), (admin, '/admin/show/section'), (admin, f'/section/{section}/'),
+             (admin, '/book/status'), (admin, f'/book/status/info/{book}')]
+
+    print(f'{"page":>28} {"200 ms":>8} {"queries":>8} {"304 ms":>8} {"queries":>8}')
+    for client, url in pages:
+        client.get(url)  # shows any flashed messages, which turn caching off for one request
+        response, full_ms, full_queries = measure(client, url, args.requests)
+        revalidated, cached_ms, cached_queries = measure(client, url, args.requests, response.headers['ETag'])
+        assert revalidated.status_code == 304, (url, revalidated.status_code)
+        print(f'{url:>28} {full_ms:>8.2f} {full_queries:>8.1f} {cached_ms:>8.2f} {cached_queries:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Queries and latency per request with and without the cross-request user cache.
+#
+#   python -m benchmarks.current_user [--requests 200]
+#
+# Logs in a reader and an admin and requests each route repeatedly, first with
+# USER_CACHE_SIZE=0 (a user query on every request) and then with the cache on.
+
+import argparse
+import statistics
+import time
+
+from benchmarks.library import SCALES, PASSWORD, seed_library, scratch_app
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+USER_ROUTES = ['/index', '/profile', '/user/book_issue', '/user/book_issue/history', '/book/request/{book}',
+               '/book/payment/{book}']
+ADMIN_ROUTES = ['/admin', '/dashboard', '/admin/show/section', '/book/all_book', '/book/status']
+
+
+def login(username):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': PASSWORD})
+    return client
+
+
+def measure(client, urls, requests):
+    queries, timings = [], []
+    for _ in range(requests):
+        for url in urls:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(int(response.headers['X-Query-Count']))
+    return statistics.mean(queries), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        library = seed_library(**SCALES['small'])
+        sweep_overdue()
+        user_routes = [url.format(book=library['book_ids'][0]) for url in USER_ROUTES]
+        clients = {'user': (login(library['usernames'][0]), user_routes), 'admin': (login('admin@bench'), ADMIN_ROUTES)}
+
+        print(f'{"routes":>8} {"cache":>6} {"queries/request":>16} {"p50 ms":>8}')
+        for size in (0, 1024):
+            app.config['USER_CACHE_SIZE'] = size
+            for name, (client, urls) in clients.items():
+                queries, p50 = measure(client, urls, args.requests)
+                print(f'{name:>8} {"on" if size else "off":>6} {queries:>16.2f} {p50:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Memory and throughput of the streaming loan history export.
+#
+#   python -m benchmarks.export_stream [--sizes 100000,1000000,5000000] [--format csv]
+#
+# For every size it exports all loans to /dev/null and reports the time taken
+# and the peak memory allocated by Python while doing so, which should stay the
+# same whatever the number of rows. Tracing allocations slows the export down,
+# so the rows/s figures are a lower bound.
+
+import argparse
+import os
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+from benchmarks.library import scratch_app
+from exports import export_chunks
+from models import db, BookIssue
+
+app = scratch_app()
+
+
+def add_loans(count, batch_size=50000):
+    while count > 0:
+        n = min(count, batch_size)
+        rows = [{'user_id': i % 1000 + 1, 'book_id': i % 5000 + 1, 'user_name': f'reader{i % 1000}@bench',
+                 'book_name': f'Book {i % 5000}', 'book_author': 'Bench',
+                 'issue_date': date(2024, 1, 1) + timedelta(days=i % 365), 'return_date': date(2024, 12, 31),
+                 'approved': 'Returned', 'feedback': 'Good read'} for i in range(n)]
+        db.session.execute(insert(BookIssue), rows)
+        db.session.commit()
+        count -= n
+
+
+def export(format):
+    with open(os.devnull, 'w') as output:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for chunk in export_chunks('loans', format):
+            output.write(chunk)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='100000,1000000,5000000')
+    parser.add_argument('--format', default='csv', choices=['csv', 'jsonl'])
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with app.app_context():
+        print(f'{"loans":>12} {"seconds":>9} {"rows/s":>11} {"peak MiB":>10}')
+        loaded = 0
+        for size in sizes:
+            add_loans(size - loaded)
+            loaded = size
+            elapsed, peak = export(args.format)
+            print(f'{size:>12,} {elapsed:>9.1f} {size / elapsed:>11,.0f} {peak / 2**20:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# The daily fine assessment over many overdue loans.
+#
+#   python -m benchmarks.fines_batch [--loans 1000000]
+#
+# Seeds a small synthetic library (see library.py) and adds --loans overdue
+# loans: some still out, some returned or revoked late, due up to 60 days
+# ago. Then times assess_fines() charging all of them, and a second run the
+# same day, which skips every loan charged by the first.
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert, text
+
+from benchmarks.library import SCALES, seed_library, scratch_app
+from fines import assess_fines
+from models import db, User, Book, BookIssue
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+
+def add_overdue_loans(count, batch_size=50000, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    books = db.session.query(Book.id, Book.name, Book.authors).all()
+    readers = db.session.query(User.id, User.username).filter_by(is_admin=False).all()
+    while count > 0:
+        n = min(count, batch_size)
+        rows = []
+        for _ in range(n):
+            book, reader = rng.choice(books), rng.choice(readers)
+            due = today - timedelta(days=rng.randrange(1, 61))
+            approved = rng.choice(['Accepted', 'Returned', 'Revoked'])
+            rows.append({'user_id': reader.id, 'book_id': book.id, 'user_name': reader.username,
+                         'book_name': book.name, 'book_author': book.authors, 'issue_date': due - timedelta(days=14),
+                         'return_date': due if approved == 'Accepted' else due + timedelta(days=rng.randrange(1, 30)),
+                         'due_date': due, 'approved': approved})
+        db.session.execute(insert(BookIssue), rows)
+        db.session.commit()
+        count -= n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loans', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed_library(**SCALES['small'])
+        sweep_overdue()
+        start = time.perf_counter()
+        add_overdue_loans(args.loans)
+        print(f'added {args.loans:,} overdue loans in {time.perf_counter() - start:.1f} s')
+
+        for run in ('first run', 'same day'):
+            start = time.perf_counter()
+            charged, total = assess_fines()
+            print(f'{run:>10}: charged {charged:,} loans {total:,} in {time.perf_counter() - start:.2f} s')
+        ledger, balances = db.session.execute(text(
+            'SELECT (SELECT sum(amount) FROM fine_ledger), (SELECT sum(balance) FROM fine_balance)')).one()
+        assert ledger == balances, 'balances disagree with the ledger'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Catalog pages with the rendered-fragment cache off, in memory and on disk.
+#
+#   python -m benchmarks.fragment_cache [--scale medium] [--requests 200]
+#
+# Seeds a synthetic library (see library.py), then requests the first page of
+# each catalog page and prints the median latency and queries for every
+# backend: "off" renders every card block, "memory" serves them from the
+# per-process LRU and "disk" from FRAGMENT_CACHE_DIR alone, as a freshly
+# started worker sharing the directory would.
+
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.library import SCALES, PASSWORD, seed_library, scratch_app, scratch_dir
+from fragments import clear_fragments
+from recommendations import build_index
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+BACKENDS = {
+    # backend: (FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_DIR)
+    'off': (0, ''),
+    'memory': (1024, ''),
+    'disk': (0, os.path.join(scratch_dir(), 'fragments')),
+}
+
+
+def measure(client, url, requests):
+    client.get(url)  # fills the cache
+    timings, queries = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(int(response.headers['X-Query-Count']))
+    return response, statistics.median(timings), statistics.mean(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        library = seed_library(**SCALES[args.scale])
+        sweep_overdue()
+        build_index()  # so the reader's picks are on the page from the first request
+
+    reader, admin = app.test_client(), app.test_client()
+    reader.post('/login', data={'username': library['usernames'][0], 'password': PASSWORD})
+    admin.post('/login', data={'username': 'admin@bench', 'password': PASSWORD})
+    pages = [(reader, '/index'), (admin, '/book/all_book')]
+    for client, url in pages:
+        client.get(url)  # shows any flashed messages
+
+    print(f'{"page":>16} {"backend":>8} {"ms":>8} {"queries":>8}')
+    bodies = {}
+    for backend, (size, folder) in BACKENDS.items():
+        app.config.update(FRAGMENT_CACHE_SIZE=size, FRAGMENT_CACHE_DIR=folder)
+        with app.app_context():
+            clear_fragments()
+        for client, url in pages:
+            response, ms, queries = measure(client, url, args.requests)
+            bodies.setdefault(url, set()).add(response.data)
+            print(f'{url:>16} {backend:>8} {ms:>8.2f} {queries:>8.1f}')
+    assert all(len(variants) == 1 for variants in bodies.values()), 'backends rendered different pages'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# A synthetic library for benchmarks.
+#
+# seed_library() fills an empty, initialised database with an admin, readers,
+# sections, books, pending requests and a loan history, all derived from one
+# random seed so two runs at the same scale load the same data. Everything is
+# written with executemany inserts, so the triggers behind the dashboard
+# counters and the search index keep up as they would in production.
+#
+# Every account's password is "bench". The admin is admin@bench, the readers
+# are reader0@bench, reader1@bench, ...
+#
+# scratch_app() builds the app a benchmark runs against, on an empty database
+# in a new temporary directory.
+
+import hashlib
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app import create_app
+from migrations import init_db
+from models import db, User, Section, Book, BookContent, BookRequest, BookIssue
+from stats import rebuild_stats
+
+SCALES = {
+    'small': {'users': 50, 'sections': 10, 'books': 500, 'requests': 1000, 'issues': 2000},
+    'medium': {'users': 500, 'sections': 50, 'books': 10000, 'requests': 5000, 'issues': 50000},
+    'large': {'users': 5000, 'sections': 200, 'books': 100000, 'requests': 20000, 'issues': 500000},
+}
+
+WORDS = ['river', 'garden', 'shadow', 'winter', 'silver', 'empire', 'ocean', 'forest', 'letter', 'island',
+         'mirror', 'storm', 'harvest', 'crown', 'lantern', 'desert', 'mountain', 'secret', 'journey', 'candle',
+         'history', 'science', 'machine', 'poetry', 'voyage', 'orchard', 'thunder', 'paper', 'glass', 'signal']
+AUTHORS = ['Ada Byron', 'Chinua Reyes', 'Mira Okafor', 'Tomas Lindqvist', 'Priya Natarajan', 'Jonas Weber',
+           'Lena Moreau', 'Kwame Mensah', 'Yuki Tanaka', 'Sofia Alvarez', 'Omar Haddad', 'Ines Costa']
+
+PASSWORD = 'bench'
+BATCH_SIZE = 10000
+
+
+def scratch_dir():
+    # A new temporary directory for a benchmark's database and other files
+    return tempfile.mkdtemp(prefix='lms-bench-')
+
+
+def scratch_database_uri():
+    return 'sqlite:///' + os.path.join(scratch_dir(), 'bench.sqlite3')
+
+
+def scratch_app(config=None):
+    # An app on a new, initialised scratch database. The URI is left in the
+    # environment for the server processes a benchmark starts.
+    os.environ['SQLALCHEMY_DATABASE_URI'] = scratch_database_uri()
+    app = create_app(config)
+    with app.app_context():
+        init_db()
+    return app
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+        db.session.commit()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '.'
+
+
+def seed_library(users, sections, books, requests, issues, seed=0):
+    # Returns a dict of what the benchmarks need to address the data: the
+    # usernames, section and book ids, and the ids of the pending requests
+    rng = random.Random(seed)
+    today = date.today()
+    revoke_after = current_app.config['REVOKE_AFTER_DAYS']
+
+    _insert(User, [{'username': 'admin@bench', 'password': PASSWORD, 'name': 'Bench Admin', 'is_admin': True}] +
+                  [{'username': f'reader{i}@bench', 'password': PASSWORD, 'name': f'Reader {i}', 'is_admin': False}
+                   for i in range(users)])
+    user_ids = dict(db.session.query(User.username, User.id).filter(User.username.like('reader%@bench')))
+    usernames = [f'reader{i}@bench' for i in range(users)]
+
+    _insert(Section, [{'name': f'{WORDS[i % len(WORDS)].title()} Section {i}', 'date_created': today - timedelta(days=i),
+                       'description': _text(rng, 12)} for i in range(sections)])
+    section_ids = [id for id, in db.session.query(Section.id).order_by(Section.id)]
+
+    texts = {}
+    for _ in range(min(books, 50)):
+        body = _text(rng, 300)
+        texts[hashlib.sha256(body.encode()).hexdigest()] = body
+    _insert(BookContent, [{'sha256': sha256, 'body': body} for sha256, body in texts.items()])
+    content_ids = [id for id, in db.session.query(BookContent.id)]
+
+    _insert(Book, [{'section_id': rng.choice(section_ids),
+                    'name': f'The {rng.choice(WORDS).title()} of the {rng.choice(WORDS).title()} {i}',
+                    'content_id': rng.choice(content_ids), 'authors': rng.choice(AUTHORS),
+                    'date_added': today - timedelta(days=rng.randrange(1000)), 'price': rng.randrange(1, 50)}
+                   for i in range(books)])
+    book_rows = db.session.query(Book.id, Book.name, Book.authors, Book.content_id).order_by(Book.id).all()
+
+    # Pending requests, at most one per reader and book
+    pairs = set()
+    while len(pairs) < min(requests, users * books):
+        pairs.add((rng.randrange(users), rng.randrange(books)))
+    request_rows = []
+    for reader, book in sorted(pairs):
+        requested = today - timedelta(days=rng.randrange(30))
+        request_rows.append({'user_id': user_ids[usernames[reader]], 'book_id': book_rows[book].id,
+                             'user_name': usernames[reader], 'book_name': book_rows[book].name,
+                             'request_date': requested, 'return_date': requested + timedelta(days=rng.randrange(7, 22)),
+                             'status': 'pending'})
+    _insert(BookRequest, request_rows)
+
+    # Loan history over the past two years; a reader holds at most five active loans
+    active = [0] * users
+    issue_rows = []
+    for _ in range(issues):
+        reader, book = rng.randrange(users), book_rows[rng.randrange(books)]
+        issued = today - timedelta(days=rng.randrange(730))
+        approved = rng.choices(['Returned', 'Revoked', 'Declined', 'Accepted'], [70, 10, 10, 10])[0]
+        if approved == 'Accepted':
+            if active[reader] >= 5:
+                approved = 'Returned'
+            else:
+                active[reader] += 1
+                issued = today - timedelta(days=rng.randrange(14))
+        # Revoked loans ended REVOKE_AFTER_DAYS after the day they were due, when the sweeper found them
+        due = issued + timedelta(days=rng.randrange(7, 22))
+        issue_rows.append({'user_id': user_ids[usernames[reader]], 'book_id': book.id, 'user_name': usernames[reader],
+                           'book_name': book.name, 'book_author': book.authors, 'issue_date': issued,
+                           'return_date': due + timedelta(days=(revoke_after + 1) * (approved == 'Revoked')),
+                           'due_date': due, 'approved': approved,
+                           'content_id': book.content_id if approved == 'Accepted' else None,
+                           'feedback': rng.choice([None, None, _text(rng, 8)]) if approved == 'Returned' else None})
+    _insert(BookIssue, issue_rows)
+
+    rebuild_stats()
+    return {
+        'usernames': usernames,
+        'section_ids': section_ids,
+        'book_ids': [book.id for book in book_rows],
+        'request_ids': [id for id, in db.session.query(BookRequest.id).order_by(BookRequest.id)],
+    }
@@ -0,0 +1,76 @@
+# Route latency while the number of active loans grows.
+#
+#   python -m benchmarks.overdue_sweep [--sizes 100,10000,100000,1000000] [--requests 50]
+#
+# For every size it times a decorated route (/index) and, for comparison, the
+# full scan of accepted loans the old check_return_and_revoke ran on every request.
+
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+from benchmarks.library import PASSWORD, seed_library, scratch_app
+from models import db, User, Book, BookIssue
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+
+def add_loans(count, batch_size=50000):
+    reader = db.session.query(User.id, User.username).filter_by(username='reader0@bench').one()
+    book = db.session.query(Book.id, Book.name, Book.authors).order_by(Book.id).first()
+    due = date.today() + timedelta(days=14)
+    while count > 0:
+        n = min(count, batch_size)
+        rows = [{'user_id': reader.id, 'book_id': book.id, 'user_name': reader.username, 'book_name': book.name,
+                 'book_author': book.authors, 'issue_date': date.today(), 'return_date': due, 'due_date': due,
+                 'approved': 'Accepted'}] * n
+        db.session.execute(insert(BookIssue), rows)
+        db.session.commit()
+        count -= n
+
+
+def time_route(client, url, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def time_legacy_scan():
+    start = time.perf_counter()
+    BookIssue.query.filter_by(approved='Accepted').all()
+    db.session.expunge_all()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='100,10000,100000,1000000')
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with app.app_context():
+        seed_library(users=1, sections=1, books=1, requests=0, issues=0)
+        sweep_overdue()
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'reader0@bench', 'password': PASSWORD})
+
+        print(f'{"active loans":>14} {"/index p50 ms":>15} {"old scan ms":>13}')
+        loaded = 0
+        for size in sizes:
+            add_loans(size - loaded)
+            loaded = size
+            route_ms = time_route(client, '/index', args.requests)
+            print(f'{size:>14,} {route_ms:>15.2f} {time_legacy_scan():>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Reader throughput while a writer keeps the database busy.
+#
+#   python -m benchmarks.read_load [--readers 4] [--seconds 10] [--write-rows 20000]
+#
+# Runs the same load once per SQLITE_PROFILE, each in a fresh process and
+# database: reader threads request catalog, search and loan pages as fast as
+# they can while one writer thread commits batches of loans back to back.
+# "default" is SQLite's rollback journal on a single engine (the old setup),
+# "production" is WAL with the read-only pool.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+PROFILES = {
+    'default': {'SQLITE_PROFILE': 'default', 'SQLITE_READ_POOL_SIZE': '0'},
+    'production': {'SQLITE_PROFILE': 'production'},
+}
+READ_URLS = ['/index', '/index?query=river', '/user/book_issue', '/index/section/{section}']
+
+
+def reader(app, library, password, seconds, timings, errors):
+    client = app.test_client()
+    client.post('/login', data={'username': library['usernames'][0], 'password': password})
+    urls = [url.format(section=library['section_ids'][0]) for url in READ_URLS]
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for url in urls:
+            start = time.perf_counter()
+            try:
+                status = client.get(url).status_code
+            except Exception:
+                status = None
+            if status == 200:
+                timings.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(url)
+
+
+def writer(app, db, library, seconds, rows, commits):
+    from sqlalchemy import text
+    from models import User
+    due = (date.today() + timedelta(days=14)).isoformat()
+    with app.app_context():
+        user_id = db.session.query(User.id).filter_by(username=library['usernames'][0]).scalar()
+    book_ids = library['book_ids']
+    batch = [{'user_id': user_id, 'book_id': book_ids[i % len(book_ids)], 'user_name': library['usernames'][0],
+              'book_name': 'Book', 'book_author': 'Bench', 'issue_date': date.today().isoformat(), 'return_date': due,
+              'approved': 'Returned'} for i in range(rows)]
+    insert = text('INSERT INTO book_issue (user_id, book_id, user_name, book_name, book_author, issue_date, return_date, '
+                  'approved) VALUES (:user_id, :book_id, :user_name, :book_name, :book_author, :issue_date, '
+                  ':return_date, :approved)')
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('BEGIN IMMEDIATE')
+                conn.execute(insert, batch)
+            commits.append(1)
+
+
+def run_profile(args):
+    # Child process: the environment already selects the profile
+    from benchmarks.library import PASSWORD, seed_library, scratch_app
+    from models import db
+    from sweeper import sweep_overdue
+
+    app = scratch_app()
+    with app.app_context():
+        library = seed_library(users=1, sections=20, books=2000, requests=0, issues=0)
+        sweep_overdue()
+
+    timings, errors, commits = [], [], []
+    threads = [threading.Thread(target=reader, args=(app, library, PASSWORD, args.seconds, timings, errors))
+               for _ in range(args.readers)]
+    threads.append(threading.Thread(target=writer, args=(app, db, library, args.seconds, args.write_rows, commits)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else [0] * 99
+    print(json.dumps({
+        'reads_per_s': len(timings) / args.seconds,
+        'p50': quantiles[49], 'p95': quantiles[94], 'p99': quantiles[98],
+        'errors': len(errors),
+        'writes_per_s': len(commits) / args.seconds,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-rows', type=int, default=20000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_profile(args)
+
+    print(f'{"profile":>11} {"reads/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7} {"writes/s":>9}')
+    for name, env in PROFILES.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.read_load', '--child', '--readers', str(args.readers),
+             '--seconds', str(args.seconds), '--write-rows', str(args.write_rows)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{name:>11} {result["reads_per_s"]:>9.0f} {result["p50"]:>8.1f} {result["p95"]:>8.1f} '
+              f'{result["p99"]:>8.1f} {result["errors"]:>7} {result["writes_per_s"]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Building the recommendation index (see recommendations.py).
+#
+#   python -m benchmarks.recommend_build [--scale medium] [--loans 10000000]
+#
+# Seeds a synthetic library (see library.py) and times reading its loans and
+# building the index from them, then builds an index from --loans synthetic
+# loans (popularity-skewed, as real borrowing is) to show how the build scales
+# past what seeding a database here allows. Also times similar_books() and
+# picks_for() lookups against the big index.
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.library import SCALES, seed_library, scratch_app
+from models import db
+from recommendations import RecommendationIndex, load_loans
+
+app = scratch_app()
+
+
+def synthetic_loans(loans, users, books, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(1, users + 1, loans), np.minimum(rng.zipf(1.3, loans), books)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--loans', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+    neighbors = app.config['RECOMMEND_NEIGHBORS']
+
+    with app.app_context():
+        seed_library(**SCALES[args.scale])
+        start = time.perf_counter()
+        with db.engine.connect() as conn:
+            users, books = load_loans(conn)
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        RecommendationIndex(users, books, neighbors)
+        built = time.perf_counter() - start
+    print(f'{args.scale} library: {len(users)} loans, read in {loaded * 1000:.1f} ms, index built in {built * 1000:.1f} ms')
+
+    users, books = synthetic_loans(args.loans, args.users, args.books)
+    start = time.perf_counter()
+    index = RecommendationIndex(users, books, neighbors)
+    built = time.perf_counter() - start
+    print(f'synthetic: {args.loans} loans, {args.users} users, {args.books} books, index built in {built:.2f} s')
+
+    rng = np.random.default_rng(1)
+    for name, lookup, ids in (('similar', index.similar, rng.integers(1, args.books + 1, args.lookups)),
+                              ('picks', index.picks, rng.integers(1, args.users + 1, args.lookups))):
+        timings = []
+        for id in ids.tolist():
+            start = time.perf_counter()
+            lookup(id)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f'{name:>8}: median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Startup time, from a fresh interpreter to the first response.
+#
+#   python -m benchmarks.startup [--runs 10]
+#
+# Each run starts a new Python process that imports app, builds the app with
+# create_app() and serves GET / from the test client, timing each step. The
+# scratch database is set up once beforehand with init_db(), as a deployment
+# would with "flask init-db", so the runs measure what a worker pays on start.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.library import scratch_database_uri
+
+CHILD = '''
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+print(imported - start, created - imported, served - created)
+'''
+
+SETUP = '''
+from app import create_app
+from migrations import init_db
+with create_app().app_context():
+    init_db()
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, 'SQLALCHEMY_DATABASE_URI': scratch_database_uri()}
+    subprocess.run([sys.executable, '-c', SETUP], env=env, check=True)
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True).stdout
+        runs.append([float(value) * 1000 for value in output.split()])
+
+    print(f'{"step":>14} {"p50 ms":>8} {"max ms":>8}')
+    for step, timings in zip(('import app', 'create_app()', 'first request'), zip(*runs)):
+        print(f'{step:>14} {statistics.median(timings):>8.1f} {max(timings):>8.1f}')
+    totals = [sum(run) for run in runs]
+    print(f'{"total":>14} {statistics.median(totals):>8.1f} {max(totals):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# Throughput and latency of the main routes, through the test client and over HTTP.
+#
+#   python -m benchmarks.suite [--scale small|medium|large] [--users N] [--books N] ...
+#                              [--driver client|http|both] [--threads 4] [--per-route 200]
+#                              [--routes index,dashboard,...] [--output FILE] [--compare FILE]
+#
+# Seeds a synthetic library (see library.py) into a scratch database, then
+# drives each route in turn from --threads concurrent sessions, --per-route
+# requests per route, first through the Flask test client and then through a
+# local multi-threaded HTTP server. Prints throughput, p50/p95/p99 latency and
+# queries per request for every route and saves the results as JSON, by
+# default to benchmarks/results/. --compare prints the change against an
+# earlier results file. The data and the request sequence only depend on
+# --seed, so runs at the same settings are comparable.
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.library import SCALES, WORDS, PASSWORD, seed_library, scratch_app
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+class Library:
+    # The seeded ids, and the pending requests and books that the write routes use up
+    def __init__(self, seeded, seed):
+        self.__dict__.update(seeded)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pending = list(reversed(self.request_ids))
+        self.next_request = 0
+
+    def pick(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def pending_request(self):
+        with self.lock:
+            return self.pending.pop() if self.pending else 0
+
+    def new_request(self, username):
+        # Books from the end of the catalog, which the seeded requests rarely use
+        with self.lock:
+            self.next_request += 1
+            book_id = self.book_ids[-1 - self.next_request % len(self.book_ids)]
+        today = date.today()
+        return f'/book/request/{book_id}', {
+            'user_name': username, 'book_name': 'Bench', 'request_date': today.isoformat(),
+            'return_date': (today + timedelta(days=14)).isoformat(),
+        }
+
+
+# name: (role, method, target); target(library, username) returns the path and form data
+ROUTES = {
+    'home': (None, 'GET', lambda lib, user: ('/', None)),
+    'index': ('user', 'GET', lambda lib, user: ('/index', None)),
+    'index_search': ('user', 'GET', lambda lib, user: ('/index?' + urlencode({'query': lib.pick(WORDS)}), None)),
+    'user_section': ('user', 'GET', lambda lib, user: (f'/index/section/{lib.pick(lib.section_ids)}', None)),
+    'book_request': ('user', 'GET', lambda lib, user: (f'/book/request/{lib.pick(lib.book_ids)}', None)),
+    'book_request_post': ('user', 'POST', lambda lib, user: lib.new_request(user)),
+    'user_book_issue': ('user', 'GET', lambda lib, user: ('/user/book_issue', None)),
+    'user_book_issue_history': ('user', 'GET', lambda lib, user: ('/user/book_issue/history', None)),
+    'admin': ('admin', 'GET', lambda lib, user: ('/admin', None)),
+    'all_books': ('admin', 'GET', lambda lib, user: ('/book/all_book', None)),
+    'admin_book_requests': ('admin', 'GET', lambda lib, user: ('/admin/book_requests', None)),
+    'book_accept': ('admin', 'GET', lambda lib, user: (f'/book/request/accept/accepted/{lib.pending_request()}', None)),
+    'book_status': ('admin', 'GET', lambda lib, user: ('/book/status', None)),
+    'book_status_info': ('admin', 'GET', lambda lib, user: (f'/book/status/info/{lib.pick(lib.book_ids)}', None)),
+    'dashboard': ('admin', 'GET', lambda lib, user: ('/dashboard', None)),
+}
+
+
+class ClientDriver:
+    # The Flask test client, without its cookie jar: every session sends the
+    # cookie it got at login, so flashed messages do not pile up in it
+    name = 'client'
+
+    def __init__(self):
+        self.client = app.test_client(use_cookies=False)
+
+    def open(self, method, path, data=None, cookie=None):
+        response = self.client.open(path, method=method, data=data, headers={'Cookie': cookie} if cookie else {})
+        return response.status_code, response.headers
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class HttpDriver:
+    # A threaded werkzeug server on a free local port, one connection per request
+    name = 'http'
+
+    def __init__(self):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def open(self, method, path, data=None, cookie=None):
+        headers = {'Cookie': cookie} if cookie else {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status, response.headers
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def login(driver, username):
+    status, headers = driver.open('POST', '/login', {'username': username, 'password': PASSWORD})
+    for value in headers.get_all('Set-Cookie') if hasattr(headers, 'get_all') else headers.getlist('Set-Cookie'):
+        if value.startswith('session='):
+            return value.split(';', 1)[0]
+    raise RuntimeError(f'login as {username} failed with HTTP {status}')
+
+
+def quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_route(driver, library, name, cookies, threads, requests, warmup):
+    role, method, target = ROUTES[name]
+    timings, queries, errors = [], [], []
+
+    def worker(number, count):
+        username, cookie = cookies[role][number] if role else (None, None)
+        for i in range(warmup + count):
+            path, data = target(library, username)
+            start = time.perf_counter()
+            try:
+                status, headers = driver.open(method, path, data, cookie)
+            except Exception as error:
+                errors.append(repr(error))
+                continue
+            if i < warmup:
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(int(headers.get('X-Query-Count', 0)))
+            if status >= 400:
+                errors.append(f'HTTP {status} {path}')
+
+    pool = [threading.Thread(target=worker, args=(n, requests // threads + (n < requests % threads)))
+            for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(timings) / elapsed, 1),
+        'p50': round(quantile(timings, 0.50), 2) if timings else None,
+        'p95': round(quantile(timings, 0.95), 2) if timings else None,
+        'p99': round(quantile(timings, 0.99), 2) if timings else None,
+        'queries': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(driver, results, baseline):
+    print(f'\n{driver}')
+    header = f'{"route":>24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>7}'
+    print(header + (f' {"Δ req/s":>8} {"Δ p95":>8}' if baseline else ''))
+    for name, result in results.items():
+        line = (f'{name:>24} {result["throughput"]:>8.1f} {result["p50"]:>8.2f} {result["p95"]:>8.2f} '
+                f'{result["p99"]:>8.2f} {result["queries"]:>8.2f} {result["errors"]:>7}')
+        before = baseline.get(name) if baseline else None
+        if before:
+            line += (f' {result["throughput"] / before["throughput"] - 1:>+8.0%}'
+                     f' {result["p95"] / before["p95"] - 1:>+8.0%}')
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'Overrides the scale\'s number of {name}.')
+    parser.add_argument('--driver', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--per-route', type=int, default=200, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per thread and route.')
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Defaults to benchmarks/results/suite-<time>.json.')
+    parser.add_argument('--compare', help='An earlier results file.')
+    args = parser.parse_args()
+
+    routes = args.routes.split(',')
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f'unknown routes: {", ".join(sorted(unknown))}')
+    scale = {name: getattr(args, name) or count for name, count in SCALES[args.scale].items()}
+    scale['users'] = max(scale['users'], args.threads)
+    drivers = [ClientDriver, HttpDriver] if args.driver == 'both' else [{'client': ClientDriver, 'http': HttpDriver}[args.driver]]
+    baseline = json.load(open(args.compare))['results'] if args.compare else {}
+
+    with app.app_context():
+        start = time.perf_counter()
+        library = Library(seed_library(seed=args.seed, **scale), args.seed)
+        sweep_overdue()
+        print(f'seeded {", ".join(f"{count:,} {name}" for name, count in scale.items())} '
+              f'in {time.perf_counter() - start:.1f} s')
+
+    results = {}
+    for driver_class in drivers:
+        driver = driver_class()
+        try:
+            cookies = {
+                'user': [(username, login(driver, username)) for username in library.usernames[:args.threads]],
+                'admin': [('admin@bench', login(driver, 'admin@bench'))] * args.threads,
+            }
+            results[driver.name] = {name: run_route(driver, library, name, cookies, args.threads, args.per_route, args.warmup)
+                                    for name in routes}
+        finally:
+            driver.close()
+        print_results(driver.name, results[driver.name], baseline.get(driver.name))
+
+    output = args.output or os.path.join(RESULTS_DIR, f'suite-{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'scale': scale, 'threads': args.threads, 'per_route': args.per_route,
+                         'warmup': args.warmup, 'seed': args.seed},
+            'results': results,
+        }, file, indent=2)
+    print(f'\nsaved {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Dashboard trends from the daily rollups against grouping the loans directly.
+#
+#   python -m benchmarks.trending [--scale medium] [--repeat 20]
+#
+# Seeds a synthetic library with two years of loans (see library.py), times
+# the rollup job folding the seeded events into the daily tables, then for
+# each dashboard window times the top books both ways: grouping the
+# book_issue rows of the window, as the dashboard would have to without
+# rollups, and reading book_daily. Also times the whole dashboard page.
+
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.library import SCALES, PASSWORD, seed_library, scratch_app
+from models import db
+from rollups import roll_up
+from stats import TREND_WINDOWS, trending_books
+from sweeper import sweep_overdue
+
+app = scratch_app()
+
+RAW_TRENDING = text('''
+    SELECT book.name, top.total FROM (
+        SELECT book_id, count(*) AS total FROM book_issue
+        WHERE issue_date BETWEEN :start AND :end AND approved IN ('Accepted', 'Returned', 'Revoked')
+        GROUP BY book_id ORDER BY total DESC, book_id LIMIT 5
+    ) AS top JOIN book ON book.id = top.book_id
+    ORDER BY top.total DESC, top.book_id''')
+
+
+def median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=list(SCALES), default='medium')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed_library(**SCALES[args.scale])
+        sweep_overdue()
+        start = time.perf_counter()
+        events = roll_up()
+        print(f'rollup job: {events} events in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+        print(f'{"window":>8} {"grouped ms":>11} {"rollups ms":>11}')
+        today = date.today()
+        for days in TREND_WINDOWS:
+            window = {'start': (today - timedelta(days=days - 1)).isoformat(), 'end': today.isoformat()}
+            raw, raw_ms = median_ms(lambda: db.session.execute(RAW_TRENDING, window).all(), args.repeat)
+            rolled, rolled_ms = median_ms(lambda: trending_books(today - timedelta(days=days - 1), today), args.repeat)
+            assert [tuple(row) for row in raw] == [tuple(row) for row in rolled], 'rollups disagree with the loans'
+            print(f'{days:>8} {raw_ms:>11.2f} {rolled_ms:>11.2f}')
+
+    admin = app.test_client()
+    admin.post('/login', data={'username': 'admin@bench', 'password': PASSWORD})
+    admin.get('/dashboard')
+    print(f'{"page":>24} {"ms":>8} {"queries":>8}')
+    for query in [f'?days={days}' for days in TREND_WINDOWS] + [f'?start={date.today().year - 2}-01-01&end={date.today()}']:
+        response, ms = median_ms(lambda: admin.get('/dashboard' + query), args.repeat)
+        print(f'{"/dashboard" + query:>24} {ms:>8.2f} {response.headers["X-Query-Count"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from sqlalchemy import select
+
+from models import db, LibraryStat
+from users import current_user
+
+
+# HTTP caching.
+#
+# Pages built only from the catalog (books and sections) or the loans (issues
+# and requests) stay the same for a given user until one of those changes.
+# Triggers count the changes in library_stat (migrations.add_change_counters),
+# so a @conditional('catalog') page can send an ETag made of the change
+# counters, the user, the URL and the deployed templates, plus a Last-Modified
+# time. A browser revalidating its copy then gets 304 Not Modified after a
+# single primary key lookup, before the view runs or a template is rendered.
+# Responses are private and revalidated on every use (Cache-Control:
+# no-cache), so a change shows up on the next request.
+#
+# Pages may also depend on state kept in memory rather than in the database,
+# such as the recommendation index. Its module registers it as a scope of its
+# own with register_scope(), and a page that uses it names it like any other.
+#
+# Static files are linked with a fingerprint of their contents (?v=...) and a
+# fingerprinted URL may be cached for a year: a changed file gets a new URL.
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+_fingerprints = {}  # static file path -> (mtime, fingerprint)
+_templates_digest = None
+_process_scopes = {}  # scope -> function returning its (version, Unix time of the last change)
+
+
+def register_scope(scope, state):
+    _process_scopes[scope] = state
+
+
+def change_state(scopes, conn=None):
+    # The change counters of the scopes, and when the newest change happened.
+    # conn is a connection to use instead of db.session (see asgi.py).
+    names = [f'{scope}_{field}' for scope in scopes if scope not in _process_scopes
+             for field in ('version', 'modified')]
+    values = {}
+    if names:
+        query = select(LibraryStat.name, LibraryStat.value).where(LibraryStat.name.in_(names))
+        values = dict((conn or db.session).execute(query).all())
+    for scope in scopes:
+        if scope in _process_scopes:
+            values[f'{scope}_version'], values[f'{scope}_modified'] = _process_scopes[scope]()
+    versions = tuple(values.get(f'{scope}_version', 0) for scope in scopes)
+    modified = max(values.get(f'{scope}_modified', 0) for scope in scopes)
+    return versions, datetime.fromtimestamp(modified, timezone.utc)
+
+
+def templates_digest():
+    # Changes with every deploy that touches a template, so cached pages do too
+    global _templates_digest
+    if _templates_digest is None:
+        digest = hashlib.sha256()
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as file:
+                    digest.update(os.path.relpath(file.name, folder).encode() + file.read())
+        _templates_digest = digest.hexdigest()
+    return _templates_digest
+
+
+def page_validators(scopes, user, full_path, conn=None):
+    # (ETag, Last-Modified) of a page built from the scopes
+    versions, modified = change_state(scopes, conn)
+    key = repr((templates_digest(), versions, tuple(user or ()), full_path))
+    return hashlib.sha256(key.encode()).hexdigest()[:32], modified
+
+
+def is_fresh(etag, modified, if_none_match, if_modified_since):
+    # If-None-Match wins over If-Modified-Since when a client sends both
+    if if_none_match:
+        return if_none_match.contains(etag)
+    return if_modified_since is not None and modified <= if_modified_since
+
+
+def conditional(*scopes):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Flashed messages only show on a fresh render; the debug server
+            # reloads templates without a deploy
+            if '_flashes' in session or current_app.debug:
+                return func(*args, **kwargs)
+
+            etag, modified = page_validators(scopes, current_user(), request.full_path)
+            if is_fresh(etag, modified, request.if_none_match, request.if_modified_since):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorate
+
+
+def static_fingerprint(filename):
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as file:
+            cached = _fingerprints[path] = (mtime, hashlib.sha256(file.read()).hexdigest()[:12])
+    return cached[1]
+
+
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+
+def cache_static(response):
+    # Only the current fingerprint is cached for long, so a stale link cannot
+    # pin an old copy
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        fingerprint = request.args.get('v')
+        if fingerprint and fingerprint == static_fingerprint(request.view_args['filename']):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+    return response
+
+
+def init_app(app):
+    app.url_defaults(add_static_fingerprint)
+    app.after_request(cache_static)
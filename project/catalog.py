@@ -0,0 +1,100 @@
+from sqlalchemy import select, union_all
+
+from flask import current_app, render_template
+from caching import templates_digest
+from fragments import cached_fragments
+from models import db, Section, Book
+
+
+# Keyset ("load more") pagination for catalog pages.
+#
+# Every page is fetched with `WHERE id > :after ORDER BY id LIMIT n + 1`, which
+# the primary key and ix_book_section_id indexes answer directly, so a page
+# costs the same however deep into the catalog it is. The extra row only tells
+# us whether there is a next page; its cursor is the id of the last row shown.
+#
+# Book cards are plain rows with just the columns the cards display, so listing
+# pages never load Book.content. The card block of each section on a page is
+# rendered once per section version and then served from fragments.py.
+
+CARD_COLUMNS = (Book.id, Book.name, Book.authors, Book.date_added, Book.section_id)
+
+
+def _page(rows, limit, key=lambda row: row.id):
+    # Splits limit + 1 fetched rows into (page, cursor of the next page or None)
+    if len(rows) > limit:
+        return rows[:limit], key(rows[limit - 1])
+    return rows, None
+
+
+def section_page(after=None, limit=None):
+    if limit is None:
+        limit = current_app.config['CATALOG_PAGE_SIZE']
+    query = Section.query.order_by(Section.id)
+    if after:
+        query = query.filter(Section.id > after)
+    return _page(query.limit(limit + 1).all(), limit)
+
+
+def book_page(section_id, after=None, limit=None):
+    # One page of book cards from a single section
+    if limit is None:
+        limit = current_app.config['CATALOG_PAGE_SIZE']
+    query = select(*CARD_COLUMNS).where(Book.section_id == section_id)
+    if after:
+        query = query.where(Book.id > after)
+    rows = db.session.execute(query.order_by(Book.id).limit(limit + 1)).all()
+    return _page(rows, limit)
+
+
+def book_cards(ids):
+    # Cards of the books with these ids, in the same order
+    if not ids:
+        return []
+    rows = db.session.execute(select(*CARD_COLUMNS).where(Book.id.in_(ids))).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[id] for id in ids if id in by_id]
+
+
+def section_cards(sections, per_section=None):
+    # The first cards of every section on a page, fetched in one query. Returns
+    # {section id: (cards, cursor for the section's next page or None)}.
+    if per_section is None:
+        per_section = current_app.config['CATALOG_CARDS_PER_SECTION']
+    if not sections:
+        return {}
+
+    # One small indexed LIMIT query per section, glued together with UNION ALL.
+    # SQLite only allows LIMIT on the whole compound, hence the subqueries.
+    parts = []
+    for section in sections:
+        first = (select(*CARD_COLUMNS)
+                 .where(Book.section_id == section.id)
+                 .order_by(Book.id)
+                 .limit(per_section + 1)
+                 .subquery())
+        parts.append(select(first))
+    rows = db.session.execute(union_all(*parts)).all()
+
+    by_section = {section.id: [] for section in sections}
+    for row in sorted(rows, key=lambda row: row.id):
+        by_section[row.section_id].append(row)
+    return {id: _page(cards, per_section) for id, cards in by_section.items()}
+
+
+def section_card_fragments(sections, admin=False):
+    # The rendered card block (section_cards.html) of every section on a page.
+    # Only the sections missing from the fragment cache are queried and rendered.
+    per_section = current_app.config['CATALOG_CARDS_PER_SECTION']
+    by_id = {section.id: section for section in sections}
+    keys = {section.id: ('section_cards', admin, section.id, section.version, per_section, templates_digest())
+            for section in sections}
+
+    def render(ids):
+        missing = [by_id[id] for id in ids]
+        cards = section_cards(missing, per_section)
+        return {section.id: render_template('section_cards.html', section=section, books=cards[section.id][0],
+                                            more_after=cards[section.id][1], admin=admin)
+                for section in missing}
+
+    return cached_fragments(keys, render)
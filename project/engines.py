@@ -0,0 +1,100 @@
+import sqlite3
+
+from flask import current_app, g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite.aiosqlite import AsyncAdapt_aiosqlite_connection
+from sqlalchemy.engine import make_url
+
+
+# SQLite connection tuning and read/write engine routing.
+#
+# Every new connection gets the PRAGMAs of the SQLITE_PROFILE setting. The
+# "production" profile switches the database to WAL, so readers keep reading
+# while a write transaction (an approval, the overdue sweep) is open, and
+# writers wait for each other for up to busy_timeout ms instead of failing
+# with "database is locked".
+#
+# Routes marked @read_only run their queries on a second pool of connections
+# to the same file, the "read" bind, opened with query_only so a stray write
+# fails instead of queueing behind the writer. Everything else, and every
+# flush, uses the default engine.
+
+SQLITE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -32000,  # KiB
+        'mmap_size': 256 * 2**20,
+        'temp_store': 'MEMORY',
+    },
+    # SQLite's own defaults, rollback journal included
+    'default': {
+        'busy_timeout': 5000,
+    },
+}
+
+READ_ONLY_ENDPOINTS = set()
+
+
+def read_only(func):
+    READ_ONLY_ENDPOINTS.add(func.__name__)
+    return func
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_read_bind(app):
+    # Adds the "read" bind, unless the database is in memory (a second engine
+    # would open a different, empty database) or SQLITE_READ_POOL_SIZE is 0
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if is_sqlite_file(uri) and app.config['SQLITE_READ_POOL_SIZE'] > 0:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})['read'] = {
+            'url': uri,
+            'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+        }
+
+
+def tune_engines(db):
+    pragmas = SQLITE_PROFILES[current_app.config['SQLITE_PROFILE']]
+    for key, engine in db.engines.items():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', pragma_setter(pragmas, query_only=key == 'read'))
+
+
+def pragma_setter(pragmas, query_only):
+    def set_pragmas(dbapi_connection, connection_record):
+        # pysqlite connections, and SQLAlchemy's adapter around aiosqlite (see asgi.py)
+        if not isinstance(dbapi_connection, (sqlite3.Connection, AsyncAdapt_aiosqlite_connection)):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if query_only:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+    return set_pragmas
+
+
+class RoutingSession(Session):
+    # Sends the queries of @read_only routes to the "read" bind when there is one
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('read_only'):
+            engine = self._db.engines.get('read')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def route_reads():
+    # Endpoints are "blueprint.view"; @read_only registers the view name
+    g.read_only = (request.endpoint or '').rpartition('.')[2] in READ_ONLY_ENDPOINTS
+
+
+def init_app(app):
+    app.before_request(route_reads)
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import sys
+from datetime import date
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from models import db, User, Book, BookIssue, BookRequest
+
+
+# Streaming exports of the loan history and book requests.
+#
+# Rows are read with yield_per, which streams them off the cursor in chunks
+# instead of loading the whole result, and every chunk is written out as one
+# piece of CSV or JSON lines before the next one is fetched. Memory stays flat
+# however many rows match. The same generators back the admin export routes
+# (as streamed responses) and the `flask export` command.
+
+EXPORTS = {
+    'loans': {
+        'model': BookIssue,
+        'columns': ('id', 'user_id', 'user_name', 'book_id', 'book_name', 'book_author', 'issue_date', 'return_date', 'approved', 'feedback'),
+        'date': 'issue_date',
+        'status': 'approved',
+    },
+    'requests': {
+        'model': BookRequest,
+        'columns': ('id', 'user_id', 'user_name', 'book_id', 'book_name', 'request_date', 'return_date', 'status'),
+        'date': 'request_date',
+        'status': 'status',
+    },
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def export_query(kind, since=None, until=None, status=None, user=None, book=None):
+    # since and until are inclusive dates on the loan's issue date or the request date
+    export = EXPORTS[kind]
+    model = export['model']
+    query = select(*(getattr(model, column) for column in export['columns']))
+    if since:
+        query = query.where(getattr(model, export['date']) >= since)
+    if until:
+        query = query.where(getattr(model, export['date']) <= until)
+    if status:
+        query = query.where(getattr(model, export['status']) == status)
+    # By id, so the (user_id, ...) and (book_id, ...) indexes are used
+    if user:
+        query = query.where(model.user_id == select(User.id).where(User.username == user).scalar_subquery())
+    if book:
+        query = query.where(model.book_id.in_(select(Book.id).where(Book.name == book)))
+    return query.order_by(model.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+
+def _csv_chunks(columns, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl_chunks(columns, partitions):
+    for rows in partitions:
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+
+
+def export_chunks(kind, format, **filters):
+    # Yields the export as text chunks, one per EXPORT_CHUNK_SIZE rows
+    columns = EXPORTS[kind]['columns']
+    partitions = db.session.execute(export_query(kind, **filters)).partitions()
+    if format == 'csv':
+        return _csv_chunks(columns, partitions)
+    return _jsonl_chunks(columns, partitions)
+
+
+def parse_filters(values):
+    # Export filters from request args or CLI options; raises ValueError on a bad date
+    filters = {}
+    for name in ('since', 'until'):
+        if values.get(name):
+            filters[name] = date.fromisoformat(values[name])
+    for name in ('status', 'user', 'book'):
+        if values.get(name):
+            filters[name] = values[name]
+    return filters
+
+
+@click.command('export') # flask export loans|requests: stream the loan history or requests as CSV or JSON lines
+@with_appcontext
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--since', help='First issue/request date, YYYY-MM-DD.')
+@click.option('--until', help='Last issue/request date, YYYY-MM-DD.')
+@click.option('--status', help='e.g. Accepted, Returned, Revoked, pending.')
+@click.option('--user', help='Username.')
+@click.option('--book', help='Book name.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8', lazy=False), help='Defaults to stdout.')
+def export_command(kind, format, output, **options):
+    try:
+        filters = parse_filters(options)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+    output = output or sys.stdout
+    for chunk in export_chunks(kind, format, **filters):
+        output.write(chunk)
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
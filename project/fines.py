@@ -0,0 +1,147 @@
+from datetime import date, datetime, timedelta
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from metrics import FINES_SECONDS, FINES_CHARGED
+from models import db, User, BookIssue, FineLedger, FineBalance
+
+
+# Fines for overdue loans.
+#
+# A loan is overdue from the day after its due_date (or its issue_date, for
+# loans issued after they were due) until it ends: the day it is returned or
+# revoked, or today while it is still out. The sweeper leaves
+# overdue loans out for REVOKE_AFTER_DAYS before revoking them, so readers can
+# still return them late. Each overdue day costs FINE_DAILY_RATE, up to
+# FINE_CAP_RATIO times the price of the book.
+#
+# assess_fines() is the daily billing batch. One INSERT ... SELECT works out
+# the fine each candidate loan has accrued so far and posts whatever part of it
+# has not been charged yet to fine_ledger, so each day of a loan is only
+# charged once. The candidates are the overdue loans still out, and the loans
+# that ended since the last run (the date in the library_stat row
+# fines_assessed_on), both found through the (approved, return_date) index, so
+# a run does not rescan the whole loan history; loans already charged today
+# are skipped. Admins record payments as negative entries. fine_balance holds
+# the sum of each reader's entries, kept by a trigger (migrations.add_fines),
+# so balances are single-row lookups.
+
+_ASSESS = text('''
+    WITH loans AS (
+        SELECT id, user_id, book_id, max(due_date, issue_date) AS due_date, :today AS ended FROM book_issue
+        WHERE approved = 'Accepted' AND return_date < :today
+        UNION ALL
+        SELECT id, user_id, book_id, max(due_date, issue_date), return_date FROM book_issue
+        WHERE approved IN ('Returned', 'Revoked') AND return_date >= :since AND due_date < return_date
+    ), accrued AS (
+        SELECT loans.id, loans.user_id,
+               min(:rate * CAST(julianday(ended) - julianday(due_date) AS INTEGER),
+                   CAST(:cap * book.price AS INTEGER)) AS amount,
+               coalesce((SELECT sum(amount) FROM fine_ledger
+                         WHERE fine_ledger.loan_id = loans.id AND kind = 'fine'), 0) AS charged
+        FROM loans JOIN book ON book.id = loans.book_id
+        WHERE NOT EXISTS (SELECT 1 FROM fine_ledger
+                          WHERE fine_ledger.loan_id = loans.id AND posted_on = :today AND kind = 'fine')
+    )
+    INSERT INTO fine_ledger (user_id, loan_id, posted_on, amount, kind)
+    SELECT user_id, id, :today, amount - charged, 'fine' FROM accrued WHERE amount > charged''')
+
+_ASSESSED_ON = text("SELECT value FROM library_stat WHERE name = 'fines_assessed_on'")
+_SET_ASSESSED_ON = text('''
+    INSERT INTO library_stat (name, value) VALUES ('fines_assessed_on', :day)
+    ON CONFLICT (name) DO UPDATE SET value = excluded.value''')
+
+
+def assess_fines():
+    # Charges overdue loans what they accrued since the last run. Returns the
+    # number of loans charged and the total amount.
+    config = current_app.config
+    today = datetime.now().date()
+
+    start = time.perf_counter()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        # Stored as a day number; before the first run every ended loan is a candidate
+        assessed_on = conn.execute(_ASSESSED_ON).scalar()
+        since = date.fromordinal(assessed_on) if assessed_on else date.min
+        last_id = conn.exec_driver_sql('SELECT coalesce(max(id), 0) FROM fine_ledger').scalar()
+        conn.execute(_ASSESS, {'today': today.isoformat(), 'since': since.isoformat(),
+                               'rate': config['FINE_DAILY_RATE'], 'cap': config['FINE_CAP_RATIO']})
+        conn.execute(_SET_ASSESSED_ON, {'day': today.toordinal()})
+        charged, total = conn.execute(text('SELECT count(*), coalesce(sum(amount), 0) FROM fine_ledger WHERE id > :id'),
+                                      {'id': last_id}).one()
+    FINES_SECONDS.observe(time.perf_counter() - start)
+    FINES_CHARGED.inc(charged)
+    return charged, total
+
+
+def record_payment(user_id, amount):
+    db.session.add(FineLedger(user_id=user_id, posted_on=datetime.now().date(), amount=-amount, kind='payment'))
+    db.session.commit()
+
+
+def fine_balance(user_id):
+    balance = db.session.query(FineBalance.balance).filter_by(user_id=user_id).scalar()
+    return balance or 0
+
+
+def fine_entries(user_id, limit=50):
+    # The reader's latest ledger entries, with the book and dates of the loan fined
+    return (db.session.query(FineLedger.posted_on, FineLedger.kind, FineLedger.amount,
+                             BookIssue.book_name, BookIssue.due_date, BookIssue.return_date)
+            .outerjoin(BookIssue, BookIssue.id == FineLedger.loan_id)
+            .filter(FineLedger.user_id == user_id)
+            .order_by(FineLedger.id.desc())
+            .limit(limit)
+            .all())
+
+
+def outstanding_balances(limit=100):
+    # (readers owing the most, with their balances; total owed by everyone),
+    # read off the ix_fine_balance_balance index
+    owing = (db.session.query(User.id, User.username, User.name, FineBalance.balance)
+             .join(FineBalance, FineBalance.user_id == User.id)
+             .filter(FineBalance.balance > 0)
+             .order_by(FineBalance.balance.desc())
+             .limit(limit)
+             .all())
+    total = db.session.query(db.func.sum(FineBalance.balance)).filter(FineBalance.balance > 0).scalar()
+    return owing, total or 0
+
+
+def _seconds_until_tomorrow():
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, (midnight - now).total_seconds())
+
+
+def _run_billing(app):
+    while True:
+        try:
+            with app.app_context():
+                assess_fines()
+        except Exception:
+            app.logger.exception('Fine assessment failed')
+        time.sleep(_seconds_until_tomorrow())
+
+
+def start_billing(app):
+    thread = threading.Thread(target=_run_billing, args=(app,), name='fines', daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command('assess-fines') # flask assess-fines: charge overdue loans their accrued fines now, e.g. from cron
+@with_appcontext
+def assess_fines_command():
+    charged, total = assess_fines()
+    click.echo(f'Charged {total} in fines to {charged} overdue loan(s)')
+
+
+def init_app(app):
+    app.cli.add_command(assess_fines_command)
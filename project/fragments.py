@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+from metrics import FRAGMENT_HITS, FRAGMENT_MISSES
+
+
+# Rendered template fragments.
+#
+# A fragment is stored under a key that changes whenever its content would:
+# for a block of book cards, the section id and the section's version, which
+# triggers bump on every book change (migrations.add_section_versions), plus a
+# digest of the templates. Entries are never invalidated, only superseded.
+#
+# The first level is a per-process LRU of FRAGMENT_CACHE_SIZE entries. With
+# FRAGMENT_CACHE_DIR set, fragments are also written there, one file per key,
+# so all workers on a host share every render; the directory can be emptied at
+# any time. Hits and misses are counted in metrics.py.
+
+_fragments = OrderedDict()
+_fragments_lock = threading.Lock()
+
+
+def _digest(key):
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def _remember(digest, html):
+    with _fragments_lock:
+        _fragments[digest] = html
+        _fragments.move_to_end(digest)
+        while len(_fragments) > current_app.config['FRAGMENT_CACHE_SIZE']:
+            _fragments.popitem(last=False)
+
+
+def _disk_path(digest):
+    return os.path.join(current_app.config['FRAGMENT_CACHE_DIR'], digest[:2], f'{digest}.html')
+
+
+def _load(digest):
+    with _fragments_lock:
+        html = _fragments.get(digest)
+        if html is not None:
+            _fragments.move_to_end(digest)
+            return html
+    if current_app.config['FRAGMENT_CACHE_DIR']:
+        try:
+            with open(_disk_path(digest), encoding='utf-8') as file:
+                html = file.read()
+        except OSError:
+            return None
+        _remember(digest, html)
+        return html
+    return None
+
+
+def _store(digest, html):
+    _remember(digest, html)
+    if current_app.config['FRAGMENT_CACHE_DIR']:
+        # Written next to the final file and moved into place, so another
+        # worker never reads half a fragment
+        path = _disk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(html)
+        os.replace(tmp_path, path)
+
+
+def cached_fragments(keys, render):
+    # keys maps names to cache keys; render(names) renders the named fragments
+    # that were not cached and returns {name: html}. Returns {name: Markup}.
+    digests = {name: _digest(key) for name, key in keys.items()}
+    fragments = {}
+    for name, digest in digests.items():
+        html = _load(digest)
+        if html is not None:
+            fragments[name] = html
+    missing = [name for name in keys if name not in fragments]
+    FRAGMENT_HITS.inc(len(fragments))
+    FRAGMENT_MISSES.inc(len(missing))
+
+    if missing:
+        for name, html in render(missing).items():
+            _store(digests[name], html)
+            fragments[name] = html
+    return {name: Markup(html) for name, html in fragments.items()}
+
+
+def clear_fragments():
+    with _fragments_lock:
+        _fragments.clear()
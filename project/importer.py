@@ -0,0 +1,196 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import date
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+
+from models import db, Section, Book, BookContent
+
+
+# Bulk catalog import.
+#
+#   flask --app app import-catalog books.csv [--format csv|jsonl] [--batch-size 5000]
+#
+# Every row is one book, with these fields (CSV header or JSON keys):
+#
+#   section              section name, created on first use
+#   name                 book name, unique across the catalog
+#   authors, content
+#   price                whole number, 0 or more
+#   date_added           YYYY-MM-DD, defaults to today
+#   section_description  used when the section is created
+#
+# A row without a name only creates its section; every other field above is
+# required for a book. The file is streamed and inserted in batches, each batch
+# in its own transaction: the texts with one INSERT OR IGNORE into
+# book_content, the books with one executemany. Names already in the catalog
+# (or earlier in the file) are rejected against a set loaded once up front, so
+# the import never queries per row.
+
+BOOK_FIELDS = ('section', 'name', 'authors', 'content', 'price')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, format=None):
+    # Yields (line number, row dict) from a CSV or JSON lines file
+    if format is None:
+        format = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+    with open(path, newline='', encoding='utf-8') as file:
+        if format == 'csv':
+            # line_num is the physical line, which is what people look up in an editor
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = {'_error': f'invalid JSON: {error}'}
+            yield number, row if isinstance(row, dict) else {'_error': 'not a JSON object'}
+
+
+def clean_row(row):
+    # Returns the row as book (or section-only) values, or raises RowError
+    if '_error' in row:
+        raise RowError(row['_error'])
+    values = {key: (str(value).strip() if value is not None else '') for key, value in row.items() if key}
+    if not values.get('section'):
+        raise RowError('missing section')
+    if not values.get('name'):
+        return {'section': values['section'], 'section_description': values.get('section_description', '')}
+
+    missing = [field for field in BOOK_FIELDS if not values.get(field)]
+    if missing:
+        raise RowError('missing ' + ', '.join(missing))
+    try:
+        price = int(values['price'])
+    except ValueError:
+        raise RowError(f'price is not a whole number: {values["price"]!r}')
+    if price < 0:
+        raise RowError('price is negative')
+    try:
+        date_added = date.fromisoformat(values['date_added']) if values.get('date_added') else date.today()
+    except ValueError:
+        raise RowError(f'date_added is not YYYY-MM-DD: {values["date_added"]!r}')
+
+    return {
+        'section': values['section'],
+        'section_description': values.get('section_description', ''),
+        'name': values['name'],
+        'authors': values['authors'],
+        'content': str(row['content']),
+        'price': price,
+        'date_added': date_added,
+    }
+
+
+class CatalogImport:
+    def __init__(self, batch_size=5000, on_reject=None):
+        self.batch_size = batch_size
+        self.on_reject = on_reject
+        self.imported = 0
+        self.rejected = 0
+        self.sections_created = 0
+        self.sections = dict(db.session.execute(select(Section.name, Section.id)).all())
+        self.names = set(db.session.execute(select(Book.name)).scalars())
+        self.pending = []
+
+    def reject(self, number, row, reason):
+        self.rejected += 1
+        if self.on_reject:
+            self.on_reject(number, row, reason)
+
+    def add(self, number, row):
+        try:
+            values = clean_row(row)
+        except RowError as error:
+            self.reject(number, row, str(error))
+            return
+        if 'name' in values and values['name'] in self.names:
+            self.reject(number, row, f'book {values["name"]!r} already exists')
+            return
+        if 'name' in values:
+            self.names.add(values['name'])
+        self.pending.append(values)
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        with db.engine.begin() as conn:
+            for values in rows:
+                if values['section'] not in self.sections:
+                    result = conn.execute(insert(Section.__table__).values(
+                        name=values['section'], date_created=date.today(),
+                        description=values['section_description'], book_count=0))
+                    self.sections[values['section']] = result.inserted_primary_key[0]
+                    self.sections_created += 1
+
+            books = [values for values in rows if 'name' in values]
+            if not books:
+                return
+            digests = {}
+            for values in books:
+                values['sha256'] = hashlib.sha256(values['content'].encode()).hexdigest()
+                digests.setdefault(values['sha256'], values['content'])
+            conn.execute(
+                insert(BookContent.__table__).prefix_with('OR IGNORE'),
+                [{'sha256': digest, 'body': body} for digest, body in digests.items()])
+            content_ids = dict(conn.execute(
+                select(BookContent.sha256, BookContent.id).where(BookContent.sha256.in_(digests))).all())
+
+            conn.execute(insert(Book.__table__), [{
+                'section_id': self.sections[values['section']],
+                'name': values['name'],
+                'content_id': content_ids[values['sha256']],
+                'authors': values['authors'],
+                'date_added': values['date_added'],
+                'price': values['price'],
+                'times_issued': 0,
+            } for values in books])
+            self.imported += len(books)
+
+    def run(self, rows, on_batch=None):
+        for number, row in rows:
+            self.add(number, row)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+                if on_batch:
+                    on_batch(self)
+        self.flush()
+        return self
+
+
+@click.command('import-catalog') # flask import-catalog FILE: bulk load sections and books from CSV or JSON lines
+@with_appcontext
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction.')
+def import_catalog_command(path, format, batch_size):
+    start = time.perf_counter()
+
+    def on_reject(number, row, reason):
+        click.echo(f'{path}:{number}: rejected ({reason})', err=True)
+
+    def on_batch(job):
+        elapsed = time.perf_counter() - start
+        click.echo(f'{job.imported:,} books imported, {job.rejected:,} rejected ({job.imported / elapsed:,.0f} books/s)')
+
+    job = CatalogImport(batch_size=batch_size, on_reject=on_reject).run(read_rows(path, format), on_batch)
+    click.echo(f'Imported {job.imported:,} books into {len(job.sections):,} sections '
+               f'({job.sections_created:,} new), rejected {job.rejected:,} rows in {time.perf_counter() - start:.1f}s')
+
+
+def init_app(app):
+    app.cli.add_command(import_catalog_command)
@@ -0,0 +1,75 @@
+import time
+
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request SQL query counting.
+#
+# Every statement run through SQLAlchemy during a request is counted and timed
+# in flask.g. The totals are sent back in the X-Query-Count and X-Query-Time
+# (milliseconds) response headers and logged at debug level.
+#
+# Routes declare how many queries they may run with @query_budget(n). Going
+# over budget logs a warning, or raises when QUERY_BUDGET_STRICT is set, so a
+# test client request fails as soon as a page regresses into N+1 queries.
+
+QUERY_BUDGETS = {}
+
+
+def query_budget(limit):
+    def register(func):
+        QUERY_BUDGETS[func.__name__] = limit
+        return func
+    return register
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_time = g.get('query_time', 0.0) + elapsed
+        # Kept for the slow request log, see metrics.py
+        if current_app.config['SLOW_REQUEST_MS']:
+            g.setdefault('statements', []).append((statement, elapsed * 1000))
+
+
+def reset_query_counter():
+    # g outlives the request when the caller already had an app context pushed
+    g.query_count = 0
+    g.query_time = 0.0
+    g.statements = []
+
+
+def report_queries(response):
+    count = g.get('query_count', 0)
+    elapsed_ms = g.get('query_time', 0.0) * 1000
+    response.headers['X-Query-Count'] = str(count)
+    response.headers['X-Query-Time'] = f'{elapsed_ms:.2f}'
+    current_app.logger.debug('%s %s: %d queries in %.2f ms', request.method, request.path, count, elapsed_ms)
+
+    # Endpoints are "blueprint.view"; @query_budget registers the view name
+    budget = QUERY_BUDGETS.get((request.endpoint or '').rpartition('.')[2])
+    if budget is not None and count > budget:
+        message = f'{request.endpoint} ran {count} queries, over its budget of {budget}'
+        if current_app.config['QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+
+    return response
+
+
+def init_app(app):
+    app.before_request(reset_query_counter)
+    app.after_request(report_queries)
@@ -0,0 +1,88 @@
+import json
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db, BookRequest
+from recommendations import record_loans
+
+
+# Deciding book requests.
+#
+# Approving or rejecting a request turns it into a book_issue row and deletes
+# it, in one write transaction opened with BEGIN IMMEDIATE. SQLite only allows
+# one writer at a time, so concurrent decisions queue up behind each other
+# instead of interleaving. The loan limit is checked by the INSERT itself: it
+# counts the reader's active loans in the same statement that writes the issue,
+# as 'Accepted' below the limit and 'Declined' otherwise. Two admins clicking
+# at once can therefore never push a reader past MAX_ACTIVE_LOANS, and a
+# request is never left half decided.
+#
+# A batch of requests is decided by the same two statements. Each reader's
+# requests in the batch are numbered oldest first, and only those that still
+# fit under the limit on top of the reader's active loans are accepted.
+#
+# A loan is due on the return date the reader asked for, or on the day it is
+# issued when the request is approved after that date, so it never starts out
+# overdue.
+
+MAX_ACTIVE_LOANS = 5
+
+_DECIDE_REQUESTS = text('''
+    INSERT INTO book_issue (user_id, book_id, user_name, book_name, book_author, issue_date, return_date, due_date,
+                            approved, content_id)
+    SELECT user_id, book_id, user_name, book_name, authors,
+           CASE WHEN accepted THEN :today ELSE request_date END,
+           CASE WHEN accepted THEN max(return_date, :today) ELSE return_date END,
+           CASE WHEN accepted THEN max(return_date, :today) ELSE return_date END,
+           CASE WHEN accepted THEN 'Accepted' ELSE 'Declined' END,
+           CASE WHEN accepted THEN content_id END
+    FROM (
+        SELECT r.user_id, r.book_id, r.user_name, b.name AS book_name, b.authors, r.request_date, r.return_date,
+               b.content_id,
+               :accept AND (SELECT count(*) FROM book_issue i
+                            WHERE i.user_id = r.user_id AND i.approved = 'Accepted')
+                         + row_number() OVER (PARTITION BY r.user_id ORDER BY r.id) <= :limit AS accepted
+        FROM book_request r JOIN book b ON b.id = r.book_id
+        WHERE r.id IN (SELECT value FROM json_each(:ids))
+    )
+    RETURNING approved, user_id, book_id''')
+
+_DELETE_REQUESTS = text('DELETE FROM book_request WHERE id IN (SELECT value FROM json_each(:ids))')
+
+
+def pending_requests(after=None, limit=None):
+    # One page of pending requests, oldest first, after the request id
+    # `after`. Returns (requests, cursor of the next page or None).
+    if limit is None:
+        limit = current_app.config['REQUEST_PAGE_SIZE']
+    query = BookRequest.query.filter_by(status='pending').order_by(BookRequest.id)
+    if after:
+        query = query.filter(BookRequest.id > after)
+    requests = query.limit(limit + 1).all()
+    if len(requests) > limit:
+        return requests[:limit], requests[limit - 1].id
+    return requests, None
+
+
+def decide_requests(request_ids, accept):
+    # Decides many requests at once, oldest first within each reader's share
+    # of the limit. Returns a Counter of the new issues' statuses; requests
+    # that were already decided are not counted.
+    params = {'ids': json.dumps(sorted(set(request_ids))), 'accept': accept, 'limit': MAX_ACTIVE_LOANS,
+              'today': datetime.now().date().isoformat()}
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        issues = conn.execute(_DECIDE_REQUESTS, params).all()
+        conn.execute(_DELETE_REQUESTS, params)
+    record_loans([(issue.user_id, issue.book_id) for issue in issues if issue.approved == 'Accepted'])
+    return Counter(issue.approved for issue in issues)
+
+
+def decide_request(request_id, accept):
+    # Returns the new issue's status, 'Accepted' or 'Declined' (rejected, or
+    # over the loan limit), or None if the request was already decided
+    decided = decide_requests([request_id], accept)
+    return next(iter(decided), None)
@@ -0,0 +1,146 @@
+import bisect
+import threading
+import time
+
+from flask import before_render_template, current_app, g, request, template_rendered
+
+
+# Request, SQL, template and sweep metrics in Prometheus text format.
+#
+# Every request is timed from the first before_request hook to its
+# after_request hook and observed in per-endpoint histograms, together with
+# the number and total time of the SQL queries it ran (counted by
+# instrumentation.py). Templates are timed through Flask's render signals and
+# the overdue sweep times itself, and fragments.py counts its cache hits and
+# misses. render_metrics() formats everything for the
+# admin-only /metrics route. The numbers are per process.
+#
+# With SLOW_REQUEST_MS set, a request that takes at least that long is logged
+# as a warning along with the SQL statements it ran and their timings.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.bounds = [f'{bound:g}' for bound in buckets] + ['+Inf']
+        self.series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = sorted((values, list(counts)) for values, counts in self.series.items())
+        for values, counts in series:
+            total = 0
+            for bound, count in zip(self.bounds, counts):
+                total += count
+                yield f'{self.name}_bucket{_labels(self.labels, values, le=bound)} {total}'
+            yield f'{self.name}_sum{_labels(self.labels, values)} {counts[-1]:.6f}'
+            yield f'{self.name}_count{_labels(self.labels, values)} {total}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        yield f'{self.name} {self.value}'
+
+
+REQUEST_SECONDS = Histogram('library_request_duration_seconds', 'Time to handle a request.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_SQL_SECONDS = Histogram('library_request_sql_seconds', 'Time spent in SQL queries per request.', ('endpoint',))
+REQUEST_SQL_QUERIES = Histogram('library_request_sql_queries', 'SQL queries run per request.', ('endpoint',),
+                                buckets=QUERY_BUCKETS)
+TEMPLATE_SECONDS = Histogram('library_template_render_seconds', 'Time to render a template.', ('template',))
+SWEEP_SECONDS = Histogram('library_overdue_sweep_duration_seconds', 'Time to run the overdue sweep.')
+SWEEP_REVOKED = Counter('library_overdue_sweep_revoked_total', 'Loans revoked by the overdue sweep.')
+FRAGMENT_HITS = Counter('library_fragment_cache_hits_total', 'Rendered fragments served from the fragment cache.')
+FRAGMENT_MISSES = Counter('library_fragment_cache_misses_total', 'Fragments rendered because they were not cached.')
+ROLLUP_SECONDS = Histogram('library_rollup_duration_seconds', 'Time to add logged events to the daily rollups.')
+ROLLUP_EVENTS = Counter('library_rollup_events_total', 'Events added to the daily rollups.')
+FINES_SECONDS = Histogram('library_fine_assessment_duration_seconds', 'Time to run the daily fine assessment.')
+FINES_CHARGED = Counter('library_fines_charged_total', 'Ledger charges posted for overdue loans.')
+
+METRICS = [REQUEST_SECONDS, REQUEST_SQL_SECONDS, REQUEST_SQL_QUERIES, TEMPLATE_SECONDS, SWEEP_SECONDS, SWEEP_REVOKED,
+           FRAGMENT_HITS, FRAGMENT_MISSES, ROLLUP_SECONDS, ROLLUP_EVENTS, FINES_SECONDS, FINES_CHARGED]
+
+
+def render_metrics():
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
+
+
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def record_request(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or 'unmatched'
+    query_count = g.get('query_count', 0)
+    query_time = g.get('query_time', 0.0)
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+    REQUEST_SQL_SECONDS.observe(query_time, endpoint)
+    REQUEST_SQL_QUERIES.observe(query_count, endpoint)
+
+    slow_ms = current_app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        statements = ''.join(f'\n  {ms:8.2f} ms  {" ".join(statement.split())}' for statement, ms in g.get('statements', []))
+        current_app.logger.warning('Slow request: %s %s (%s) %d in %.1f ms, %d queries in %.1f ms%s',
+                                   request.method, request.full_path.rstrip('?'), endpoint, response.status_code,
+                                   elapsed * 1000, query_count, query_time * 1000, statements)
+    return response
+
+
+def _start_render(sender, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+
+def _end_render(sender, template, context, **extra):
+    starts = g.get('render_starts')
+    if starts:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - starts.pop(), template.name or 'string')
+
+
+def init_app(app):
+    # Registered before the other modules' hooks, so the request timer starts
+    # first and, since after_request hooks run in reverse, stops last
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_end_render, app)
@@ -0,0 +1,778 @@
+import hashlib
+import sys
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+
+# Versioned schema migrations.
+#
+# The schema version of a database is kept in SQLite's user_version pragma and
+# every function registered with @migration is one version, applied in order.
+# upgrade() runs the ones a database has not seen yet, so an existing
+# mydatalbm.sqlite3 is brought up to date in place. Never edit a migration
+# that has shipped; add a new one at the end instead.
+
+MIGRATIONS = []
+
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+
+def rebuild_table(conn, table, create_sql, copy_sql, drop_indexes=()):
+    # SQLite cannot drop or change columns in place, so create_sql builds the new
+    # layout as <table>_new, copy_sql fills it from the old table and the new one
+    # is swapped in. Indexes and triggers of the old table are recreated on the
+    # new one, except the indexes named in drop_indexes.
+    saved = conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE tbl_name = :table AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ), {'table': table}).all()
+
+    # Keep other tables' triggers and foreign keys pointing at the table name
+    # rather than having SQLite rewrite or reject them during the swap
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    conn.exec_driver_sql(create_sql)
+    conn.exec_driver_sql(copy_sql)
+    conn.exec_driver_sql(f'DROP TABLE {table}')
+    conn.exec_driver_sql(f'ALTER TABLE {table}_new RENAME TO {table}')
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+
+    for name, sql in saved:
+        if name not in drop_indexes:
+            conn.exec_driver_sql(sql)
+
+
+@migration
+def create_tables(conn):
+    # Schema of the original app, as db.create_all() used to create it
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS user (
+            id INTEGER NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            name VARCHAR(50) NOT NULL,
+            is_admin BOOLEAN NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (username)
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS section (
+            id INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            date_created DATE NOT NULL,
+            description TEXT,
+            PRIMARY KEY (id)
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS book (
+            id INTEGER NOT NULL,
+            section_id INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            content TEXT NOT NULL,
+            authors VARCHAR(255) NOT NULL,
+            date_added DATE,
+            price INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(section_id) REFERENCES section (id)
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS book_request (
+            id INTEGER NOT NULL,
+            user_name VARCHAR(255) NOT NULL,
+            book_name VARCHAR(255) NOT NULL,
+            request_date DATE,
+            return_date DATE,
+            status VARCHAR(255) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_name) REFERENCES user (username),
+            FOREIGN KEY(book_name) REFERENCES book (name)
+        )'''))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS book_issue (
+            id INTEGER NOT NULL,
+            user_name VARCHAR(255) NOT NULL,
+            book_name VARCHAR(255) NOT NULL,
+            book_author VARCHAR(255) NOT NULL,
+            issue_date DATE NOT NULL,
+            return_date DATE,
+            approved VARCHAR(255) NOT NULL,
+            read VARCHAR(255),
+            feedback VARCHAR(255),
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_name) REFERENCES user (username),
+            FOREIGN KEY(book_name) REFERENCES book (name),
+            FOREIGN KEY(book_author) REFERENCES book (authors),
+            FOREIGN KEY(issue_date) REFERENCES book_request (request_date),
+            FOREIGN KEY(return_date) REFERENCES book_request (return_date),
+            FOREIGN KEY(approved) REFERENCES book_request (status),
+            FOREIGN KEY(read) REFERENCES book (content)
+        )'''))
+
+
+@migration
+def add_lookup_indexes(conn):
+    # Indexes matching the filters used by routes.py, see HOT_QUERIES below
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_issue_approved_return_date ON book_issue (approved, return_date)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_issue_user_name_approved ON book_issue (user_name, approved)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_issue_book_name_approved ON book_issue (book_name, approved)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_request_user_name_status ON book_request (user_name, status)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_request_book_name ON book_request (book_name)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_name ON book (name)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_book_section_id ON book (section_id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_section_name ON section (name)'))
+
+
+@migration
+def add_book_search_index(conn):
+    # FTS5 index over the searchable book fields, keyed by book id. Triggers keep
+    # it in sync with every insert, update and delete of books and section renames.
+    conn.execute(text('''
+        CREATE VIRTUAL TABLE book_fts USING fts5(
+            name, authors, section_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )'''))
+    conn.execute(text('''
+        INSERT INTO book_fts (rowid, name, authors, section_name)
+        SELECT book.id, book.name, book.authors, section.name
+        FROM book JOIN section ON section.id = book.section_id'''))
+    conn.execute(text('''
+        CREATE TRIGGER book_fts_insert AFTER INSERT ON book BEGIN
+            INSERT INTO book_fts (rowid, name, authors, section_name)
+            VALUES (new.id, new.name, new.authors, (SELECT name FROM section WHERE id = new.section_id));
+        END'''))
+    conn.execute(text('''
+        CREATE TRIGGER book_fts_update AFTER UPDATE OF name, authors, section_id ON book BEGIN
+            DELETE FROM book_fts WHERE rowid = old.id;
+            INSERT INTO book_fts (rowid, name, authors, section_name)
+            VALUES (new.id, new.name, new.authors, (SELECT name FROM section WHERE id = new.section_id));
+        END'''))
+    conn.execute(text('''
+        CREATE TRIGGER book_fts_delete AFTER DELETE ON book BEGIN
+            DELETE FROM book_fts WHERE rowid = old.id;
+        END'''))
+    conn.execute(text('''
+        CREATE TRIGGER book_fts_section_rename AFTER UPDATE OF name ON section BEGIN
+            UPDATE book_fts SET section_name = new.name
+            WHERE rowid IN (SELECT id FROM book WHERE section_id = new.id);
+        END'''))
+
+
+@migration
+def add_library_stats(conn):
+    # Counters behind the dashboard, kept exact by triggers in the same transaction
+    # as every change: library-wide totals in library_stat, books per section in
+    # section.book_count and accepted issues per book in book.times_issued.
+    conn.execute(text('''
+        CREATE TABLE library_stat (
+            name VARCHAR(50) NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name)
+        )'''))
+    conn.execute(text("INSERT INTO library_stat (name) VALUES ('users'), ('sections'), ('books'), ('active_issues'), ('pending_requests')"))
+    conn.execute(text('ALTER TABLE section ADD COLUMN book_count INTEGER NOT NULL DEFAULT 0'))
+    conn.execute(text('ALTER TABLE book ADD COLUMN times_issued INTEGER NOT NULL DEFAULT 0'))
+    conn.execute(text('CREATE INDEX ix_book_times_issued ON book (times_issued)'))
+
+    for trigger in (
+        '''CREATE TRIGGER stat_user_insert AFTER INSERT ON user BEGIN
+            UPDATE library_stat SET value = value + 1 WHERE name = 'users';
+        END''',
+        '''CREATE TRIGGER stat_user_delete AFTER DELETE ON user BEGIN
+            UPDATE library_stat SET value = value - 1 WHERE name = 'users';
+        END''',
+        '''CREATE TRIGGER stat_section_insert AFTER INSERT ON section BEGIN
+            UPDATE library_stat SET value = value + 1 WHERE name = 'sections';
+        END''',
+        '''CREATE TRIGGER stat_section_delete AFTER DELETE ON section BEGIN
+            UPDATE library_stat SET value = value - 1 WHERE name = 'sections';
+        END''',
+        '''CREATE TRIGGER stat_book_insert AFTER INSERT ON book BEGIN
+            UPDATE library_stat SET value = value + 1 WHERE name = 'books';
+            UPDATE section SET book_count = book_count + 1 WHERE id = new.section_id;
+        END''',
+        '''CREATE TRIGGER stat_book_delete AFTER DELETE ON book BEGIN
+            UPDATE library_stat SET value = value - 1 WHERE name = 'books';
+            UPDATE section SET book_count = book_count - 1 WHERE id = old.section_id;
+        END''',
+        '''CREATE TRIGGER stat_book_move AFTER UPDATE OF section_id ON book WHEN new.section_id != old.section_id BEGIN
+            UPDATE section SET book_count = book_count - 1 WHERE id = old.section_id;
+            UPDATE section SET book_count = book_count + 1 WHERE id = new.section_id;
+        END''',
+        '''CREATE TRIGGER stat_book_request_insert AFTER INSERT ON book_request BEGIN
+            UPDATE library_stat SET value = value + (new.status = 'pending') WHERE name = 'pending_requests';
+        END''',
+        '''CREATE TRIGGER stat_book_request_delete AFTER DELETE ON book_request BEGIN
+            UPDATE library_stat SET value = value - (old.status = 'pending') WHERE name = 'pending_requests';
+        END''',
+        '''CREATE TRIGGER stat_book_request_update AFTER UPDATE OF status ON book_request WHEN new.status != old.status BEGIN
+            UPDATE library_stat SET value = value - (old.status = 'pending') + (new.status = 'pending') WHERE name = 'pending_requests';
+        END''',
+        '''CREATE TRIGGER stat_book_issue_insert AFTER INSERT ON book_issue BEGIN
+            UPDATE library_stat SET value = value + (new.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued + 1
+            WHERE name = new.book_name AND new.approved IN ('Accepted', 'Returned', 'Revoked');
+        END''',
+        '''CREATE TRIGGER stat_book_issue_delete AFTER DELETE ON book_issue BEGIN
+            UPDATE library_stat SET value = value - (old.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued - 1
+            WHERE name = old.book_name AND old.approved IN ('Accepted', 'Returned', 'Revoked');
+        END''',
+        '''CREATE TRIGGER stat_book_issue_update AFTER UPDATE OF approved ON book_issue WHEN new.approved != old.approved BEGIN
+            UPDATE library_stat SET value = value - (old.approved = 'Accepted') + (new.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued
+                - (old.approved IN ('Accepted', 'Returned', 'Revoked'))
+                + (new.approved IN ('Accepted', 'Returned', 'Revoked'))
+            WHERE (old.approved IN ('Accepted', 'Returned', 'Revoked')) != (new.approved IN ('Accepted', 'Returned', 'Revoked'))
+                AND name = new.book_name;
+        END''',
+    ):
+        conn.execute(text(trigger))
+
+    # Start from the current contents of the database
+    conn.execute(text('''
+        UPDATE library_stat SET value = CASE name
+            WHEN 'users' THEN (SELECT count(*) FROM user)
+            WHEN 'sections' THEN (SELECT count(*) FROM section)
+            WHEN 'books' THEN (SELECT count(*) FROM book)
+            WHEN 'active_issues' THEN (SELECT count(*) FROM book_issue WHERE approved = 'Accepted')
+            WHEN 'pending_requests' THEN (SELECT count(*) FROM book_request WHERE status = 'pending')
+        END'''))
+    conn.execute(text('UPDATE section SET book_count = (SELECT count(*) FROM book WHERE book.section_id = section.id)'))
+    conn.execute(text('''
+        UPDATE book SET times_issued = (
+            SELECT count(*) FROM book_issue
+            WHERE book_issue.book_name = book.name AND approved IN ('Accepted', 'Returned', 'Revoked')
+        )'''))
+
+
+def _sha256_hex(body):
+    return None if body is None else hashlib.sha256(body.encode()).hexdigest()
+
+
+@migration
+def move_book_content(conn):
+    # Book texts move to book_content, stored once per distinct text and keyed by
+    # its SHA-256. book.content and book_issue.read (a full copy of the text for
+    # every accepted loan) become content_id references. Triggers delete a text
+    # once no book or loan points at it any more.
+    conn.connection.driver_connection.create_function('sha256_hex', 1, _sha256_hex, deterministic=True)
+
+    conn.execute(text('''
+        CREATE TABLE book_content (
+            id INTEGER NOT NULL,
+            sha256 VARCHAR(64) NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (sha256)
+        )'''))
+    conn.execute(text('INSERT OR IGNORE INTO book_content (sha256, body) SELECT sha256_hex(content), content FROM book'))
+    conn.execute(text('INSERT OR IGNORE INTO book_content (sha256, body) SELECT sha256_hex(read), read FROM book_issue WHERE read IS NOT NULL'))
+
+    rebuild_table(conn, 'book', '''
+        CREATE TABLE book_new (
+            id INTEGER NOT NULL,
+            section_id INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            content_id INTEGER NOT NULL,
+            authors VARCHAR(255) NOT NULL,
+            date_added DATE,
+            price INTEGER NOT NULL,
+            times_issued INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id),
+            FOREIGN KEY(section_id) REFERENCES section (id),
+            FOREIGN KEY(content_id) REFERENCES book_content (id)
+        )''', '''
+        INSERT INTO book_new (id, section_id, name, content_id, authors, date_added, price, times_issued)
+        SELECT book.id, section_id, name, book_content.id, authors, date_added, price, times_issued
+        FROM book JOIN book_content ON book_content.sha256 = sha256_hex(book.content)''')
+
+    rebuild_table(conn, 'book_issue', '''
+        CREATE TABLE book_issue_new (
+            id INTEGER NOT NULL,
+            user_name VARCHAR(255) NOT NULL,
+            book_name VARCHAR(255) NOT NULL,
+            book_author VARCHAR(255) NOT NULL,
+            issue_date DATE NOT NULL,
+            return_date DATE,
+            approved VARCHAR(255) NOT NULL,
+            content_id INTEGER,
+            feedback VARCHAR(255),
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_name) REFERENCES user (username),
+            FOREIGN KEY(book_name) REFERENCES book (name),
+            FOREIGN KEY(content_id) REFERENCES book_content (id)
+        )''', '''
+        INSERT INTO book_issue_new (id, user_name, book_name, book_author, issue_date, return_date, approved, content_id, feedback)
+        SELECT book_issue.id, user_name, book_name, book_author, issue_date, return_date, approved, book_content.id, feedback
+        FROM book_issue LEFT JOIN book_content ON book_content.sha256 = sha256_hex(book_issue.read)''')
+
+    conn.execute(text('CREATE INDEX ix_book_content_id ON book (content_id)'))
+    conn.execute(text('CREATE INDEX ix_book_issue_content_id ON book_issue (content_id)'))
+
+    release = '''
+            DELETE FROM book_content WHERE id = old.content_id
+                AND NOT EXISTS (SELECT 1 FROM book WHERE content_id = old.content_id)
+                AND NOT EXISTS (SELECT 1 FROM book_issue WHERE content_id = old.content_id);'''
+    conn.execute(text(f'''
+        CREATE TRIGGER book_content_release_on_edit AFTER UPDATE OF content_id ON book
+        WHEN new.content_id != old.content_id BEGIN {release}
+        END'''))
+    conn.execute(text(f'CREATE TRIGGER book_content_release_on_book_delete AFTER DELETE ON book BEGIN {release}\n        END'))
+    conn.execute(text(f'CREATE TRIGGER book_content_release_on_issue_delete AFTER DELETE ON book_issue BEGIN {release}\n        END'))
+
+
+_LOANED = "('Accepted', 'Returned', 'Revoked')"
+
+
+@migration
+def use_integer_keys(conn):
+    # book_request and book_issue point at their user and book by id instead of
+    # by username and book name. The names stay as display copies, and a trigger
+    # rewrites them when a book is renamed or its authors change, so history
+    # follows the book. book_issue also loses the foreign keys it used to declare
+    # on book.authors and book_request's dates and status.
+    #
+    # Requests whose user or book no longer exists could never be decided and
+    # are dropped. Loans of a book that was renamed before this migration keep
+    # book_id NULL. Loans of a user who no longer exists are dropped.
+    for trigger in ('stat_book_issue_insert', 'stat_book_issue_delete', 'stat_book_issue_update'):
+        conn.execute(text(f'DROP TRIGGER {trigger}'))
+
+    rebuild_table(conn, 'book_request', '''
+        CREATE TABLE book_request_new (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            user_name VARCHAR(255) NOT NULL,
+            book_name VARCHAR(255) NOT NULL,
+            request_date DATE,
+            return_date DATE,
+            status VARCHAR(255) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id),
+            FOREIGN KEY(book_id) REFERENCES book (id)
+        )''', '''
+        INSERT INTO book_request_new (id, user_id, book_id, user_name, book_name, request_date, return_date, status)
+        SELECT * FROM (
+            SELECT id,
+                   (SELECT id FROM user WHERE username = user_name) AS user_id,
+                   (SELECT min(id) FROM book WHERE name = book_name) AS book_id,
+                   user_name, book_name, request_date, return_date, status
+            FROM book_request
+        )
+        WHERE user_id IS NOT NULL AND book_id IS NOT NULL''',
+        drop_indexes=('ix_book_request_user_name_status', 'ix_book_request_book_name'))
+
+    rebuild_table(conn, 'book_issue', '''
+        CREATE TABLE book_issue_new (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER,
+            user_name VARCHAR(255) NOT NULL,
+            book_name VARCHAR(255) NOT NULL,
+            book_author VARCHAR(255) NOT NULL,
+            issue_date DATE NOT NULL,
+            return_date DATE,
+            approved VARCHAR(255) NOT NULL,
+            content_id INTEGER,
+            feedback VARCHAR(255),
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id),
+            FOREIGN KEY(book_id) REFERENCES book (id),
+            FOREIGN KEY(content_id) REFERENCES book_content (id)
+        )''', '''
+        INSERT INTO book_issue_new (id, user_id, book_id, user_name, book_name, book_author, issue_date, return_date,
+                                    approved, content_id, feedback)
+        SELECT * FROM (
+            SELECT id,
+                   (SELECT id FROM user WHERE username = user_name) AS user_id,
+                   (SELECT min(id) FROM book WHERE name = book_name) AS book_id,
+                   user_name, book_name, book_author, issue_date, return_date, approved, content_id, feedback
+            FROM book_issue
+        )
+        WHERE user_id IS NOT NULL''',
+        drop_indexes=('ix_book_issue_user_name_approved', 'ix_book_issue_book_name_approved'))
+
+    conn.execute(text('CREATE INDEX ix_book_request_user_id_status ON book_request (user_id, status)'))
+    conn.execute(text('CREATE INDEX ix_book_request_book_id ON book_request (book_id)'))
+    conn.execute(text('CREATE INDEX ix_book_issue_user_id_approved ON book_issue (user_id, approved)'))
+    conn.execute(text('CREATE INDEX ix_book_issue_book_id_approved ON book_issue (book_id, approved)'))
+
+    for trigger in (
+        f'''CREATE TRIGGER stat_book_issue_insert AFTER INSERT ON book_issue BEGIN
+            UPDATE library_stat SET value = value + (new.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued + 1
+            WHERE id = new.book_id AND new.approved IN {_LOANED};
+        END''',
+        f'''CREATE TRIGGER stat_book_issue_delete AFTER DELETE ON book_issue BEGIN
+            UPDATE library_stat SET value = value - (old.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued - 1
+            WHERE id = old.book_id AND old.approved IN {_LOANED};
+        END''',
+        f'''CREATE TRIGGER stat_book_issue_update AFTER UPDATE OF approved ON book_issue WHEN new.approved != old.approved BEGIN
+            UPDATE library_stat SET value = value - (old.approved = 'Accepted') + (new.approved = 'Accepted') WHERE name = 'active_issues';
+            UPDATE book SET times_issued = times_issued - (old.approved IN {_LOANED}) + (new.approved IN {_LOANED})
+            WHERE (old.approved IN {_LOANED}) != (new.approved IN {_LOANED}) AND id = new.book_id;
+        END''',
+        '''CREATE TRIGGER book_rename_history AFTER UPDATE OF name, authors ON book
+        WHEN new.name != old.name OR new.authors != old.authors BEGIN
+            UPDATE book_request SET book_name = new.name WHERE book_id = new.id;
+            UPDATE book_issue SET book_name = new.name, book_author = new.authors WHERE book_id = new.id;
+        END''',
+    ):
+        conn.execute(text(trigger))
+
+    # Rows dropped above did not go through the counting triggers
+    conn.execute(text('''
+        UPDATE library_stat SET value = CASE name
+            WHEN 'active_issues' THEN (SELECT count(*) FROM book_issue WHERE approved = 'Accepted')
+            WHEN 'pending_requests' THEN (SELECT count(*) FROM book_request WHERE status = 'pending')
+            ELSE value
+        END'''))
+    conn.execute(text(f'''
+        UPDATE book SET times_issued = (
+            SELECT count(*) FROM book_issue WHERE book_id = book.id AND approved IN {_LOANED}
+        )'''))
+
+
+@migration
+def add_change_counters(conn):
+    # library_stat rows <scope>_version and <scope>_modified (Unix time) move
+    # with every change to the catalog (books and sections) or the loans
+    # (issues and requests), so a page built from them can tell a browser its
+    # cached copy is still current with one lookup, see caching.py. Counters
+    # like book.times_issued and section.book_count do not count as changes.
+    scopes = {
+        # scope: [(table, columns whose update counts, None for any)]
+        'catalog': [('book', 'section_id, name, content_id, authors, date_added, price'),
+                    ('section', 'name, date_created, description')],
+        'loans': [('book_issue', None), ('book_request', None)],
+    }
+    for scope, tables in scopes.items():
+        conn.execute(text(f"INSERT INTO library_stat (name, value) VALUES ('{scope}_version', 0), "
+                          f"('{scope}_modified', CAST(strftime('%s', 'now') AS INTEGER))"))
+        bump = f'''UPDATE library_stat SET value = CASE name WHEN '{scope}_version' THEN value + 1
+                                                     ELSE CAST(strftime('%s', 'now') AS INTEGER) END
+            WHERE name IN ('{scope}_version', '{scope}_modified');'''
+        for table, columns in tables:
+            for event in ('INSERT', 'DELETE', f'UPDATE OF {columns}' if columns else 'UPDATE'):
+                name = f"{scope}_{table}_{event.split()[0].lower()}"
+                conn.execute(text(f'''CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN
+            {bump}
+        END'''))
+
+
+@migration
+def add_section_versions(conn):
+    # section.version moves whenever what the catalog shows for the section
+    # changes: its name, or a book in it being added, removed, moved or having
+    # its name or authors edited. Rendered card blocks are cached under it, see
+    # fragments.py.
+    conn.execute(text('ALTER TABLE section ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+    for trigger in (
+        '''CREATE TRIGGER section_version_book_insert AFTER INSERT ON book BEGIN
+            UPDATE section SET version = version + 1 WHERE id = new.section_id;
+        END''',
+        '''CREATE TRIGGER section_version_book_delete AFTER DELETE ON book BEGIN
+            UPDATE section SET version = version + 1 WHERE id = old.section_id;
+        END''',
+        '''CREATE TRIGGER section_version_book_update AFTER UPDATE OF section_id, name, authors ON book BEGIN
+            UPDATE section SET version = version + 1 WHERE id IN (old.section_id, new.section_id);
+        END''',
+        '''CREATE TRIGGER section_version_rename AFTER UPDATE OF name ON section BEGIN
+            UPDATE section SET version = version + 1 WHERE id = new.id;
+        END''',
+    ):
+        conn.execute(text(trigger))
+
+
+
+@migration
+def add_daily_rollups(conn):
+    # Loan and request events per book and per section and day, behind the
+    # dashboard's trends. Triggers append every event to activity_log, the
+    # rollup job adds the log to book_daily and section_daily and empties it
+    # (see rollups.py). Events are dated like the loans: an issue on its
+    # issue_date, a return or revocation on its return_date, a request on the
+    # day it is made.
+    counts = '''issues INTEGER NOT NULL DEFAULT 0,
+            returns INTEGER NOT NULL DEFAULT 0,
+            revocations INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,'''
+    conn.execute(text(f'''
+        CREATE TABLE activity_log (
+            id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            book_id INTEGER NOT NULL,
+            section_id INTEGER NOT NULL,
+            {counts}
+            PRIMARY KEY (id)
+        )'''))
+    conn.execute(text(f'''
+        CREATE TABLE book_daily (
+            day DATE NOT NULL,
+            book_id INTEGER NOT NULL,
+            section_id INTEGER NOT NULL,
+            {counts}
+            PRIMARY KEY (day, book_id)
+        ) WITHOUT ROWID'''))
+    conn.execute(text(f'''
+        CREATE TABLE section_daily (
+            day DATE NOT NULL,
+            section_id INTEGER NOT NULL,
+            {counts}
+            PRIMARY KEY (day, section_id)
+        ) WITHOUT ROWID'''))
+
+    for trigger in (
+        '''CREATE TRIGGER rollup_book_issue_insert AFTER INSERT ON book_issue
+            WHEN new.approved IN ('Accepted', 'Returned', 'Revoked') BEGIN
+            INSERT INTO activity_log (day, book_id, section_id, issues)
+            SELECT new.issue_date, id, section_id, 1 FROM book WHERE id = new.book_id;
+            INSERT INTO activity_log (day, book_id, section_id, returns, revocations)
+            SELECT coalesce(new.return_date, new.issue_date), id, section_id, new.approved = 'Returned', new.approved = 'Revoked'
+            FROM book WHERE id = new.book_id AND new.approved != 'Accepted';
+        END''',
+        '''CREATE TRIGGER rollup_book_issue_update AFTER UPDATE OF approved ON book_issue
+            WHEN old.approved = 'Accepted' AND new.approved IN ('Returned', 'Revoked') BEGIN
+            INSERT INTO activity_log (day, book_id, section_id, returns, revocations)
+            SELECT coalesce(new.return_date, date('now', 'localtime')), id, section_id,
+                   new.approved = 'Returned', new.approved = 'Revoked'
+            FROM book WHERE id = new.book_id;
+        END''',
+        '''CREATE TRIGGER rollup_book_request_insert AFTER INSERT ON book_request BEGIN
+            INSERT INTO activity_log (day, book_id, section_id, requests)
+            SELECT date('now', 'localtime'), id, section_id, 1 FROM book WHERE id = new.book_id;
+        END''',
+    ):
+        conn.execute(text(trigger))
+
+    # Start from the existing history. Requests leave no date behind once
+    # decided, so every decided request is counted on the day of its issue row
+    # and every pending one on its requested date (at the latest today).
+    conn.execute(text('''
+        INSERT INTO book_daily (day, book_id, section_id, issues, returns, revocations, requests)
+        SELECT day, book_id, max(section_id), sum(issues), sum(returns), sum(revocations), sum(requests)
+        FROM (
+            SELECT i.issue_date AS day, i.book_id, b.section_id, i.approved IN ('Accepted', 'Returned', 'Revoked') AS issues,
+                   0 AS returns, 0 AS revocations, 1 AS requests
+            FROM book_issue i JOIN book b ON b.id = i.book_id
+            UNION ALL
+            SELECT coalesce(i.return_date, i.issue_date), i.book_id, b.section_id, 0,
+                   i.approved = 'Returned', i.approved = 'Revoked', 0
+            FROM book_issue i JOIN book b ON b.id = i.book_id
+            WHERE i.approved IN ('Returned', 'Revoked')
+            UNION ALL
+            SELECT min(r.request_date, date('now', 'localtime')), r.book_id, b.section_id, 0, 0, 0, 1
+            FROM book_request r JOIN book b ON b.id = r.book_id
+        )
+        GROUP BY day, book_id'''))
+    conn.execute(text('''
+        INSERT INTO section_daily (day, section_id, issues, returns, revocations, requests)
+        SELECT day, section_id, sum(issues), sum(returns), sum(revocations), sum(requests)
+        FROM book_daily GROUP BY day, section_id'''))
+
+
+@migration
+def add_fines(conn):
+    # Fines for overdue loans, see fines.py. return_date becomes the day a
+    # loan ended once it is returned or revoked, so the date it was due is
+    # kept in due_date. fine_ledger holds every charge and payment, and
+    # fine_balance each reader's running total, kept by a trigger.
+    conn.execute(text('ALTER TABLE book_issue ADD COLUMN due_date DATE'))
+    conn.execute(text('UPDATE book_issue SET due_date = return_date'))
+    conn.execute(text('''
+        CREATE TABLE fine_ledger (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            loan_id INTEGER,
+            posted_on DATE NOT NULL,
+            amount INTEGER NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )'''))
+    conn.execute(text('CREATE INDEX ix_fine_ledger_user_id ON fine_ledger (user_id)'))
+    conn.execute(text('CREATE INDEX ix_fine_ledger_loan_id ON fine_ledger (loan_id)'))
+    conn.execute(text('''
+        CREATE TABLE fine_balance (
+            user_id INTEGER NOT NULL,
+            balance INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )'''))
+    conn.execute(text('CREATE INDEX ix_fine_balance_balance ON fine_balance (balance)'))
+    conn.execute(text('''CREATE TRIGGER fine_balance_ledger_insert AFTER INSERT ON fine_ledger BEGIN
+            INSERT INTO fine_balance (user_id, balance) VALUES (new.user_id, new.amount)
+            ON CONFLICT (user_id) DO UPDATE SET balance = balance + excluded.balance;
+        END'''))
+
+
+@migration
+def use_global_section_versions(conn):
+    # Section versions counted up from 0 per row, so a section created with the
+    # id of a deleted one got that section's (id, version) keys back, and with
+    # them its cached card blocks. They now come from the library_stat row
+    # section_version, which only ever grows, so no (id, version) pair is ever
+    # handed out twice.
+    start = conn.execute(text('SELECT coalesce(max(version), 0) + 1 FROM section')).scalar()
+    conn.execute(text('UPDATE section SET version = :start + id'), {'start': start})
+    conn.execute(text("INSERT INTO library_stat (name, value) "
+                      "SELECT 'section_version', :start + coalesce(max(id), 0) FROM section"), {'start': start})
+
+    bump = '''UPDATE library_stat SET value = value + 1 WHERE name = 'section_version';
+            UPDATE section SET version = (SELECT value FROM library_stat WHERE name = 'section_version')'''
+    for name in ('book_insert', 'book_delete', 'book_update', 'rename'):
+        conn.execute(text(f'DROP TRIGGER section_version_{name}'))
+    for trigger in (
+        f'''CREATE TRIGGER section_version_book_insert AFTER INSERT ON book BEGIN
+            {bump} WHERE id = new.section_id;
+        END''',
+        f'''CREATE TRIGGER section_version_book_delete AFTER DELETE ON book BEGIN
+            {bump} WHERE id = old.section_id;
+        END''',
+        f'''CREATE TRIGGER section_version_book_update AFTER UPDATE OF section_id, name, authors ON book BEGIN
+            {bump} WHERE id IN (old.section_id, new.section_id);
+        END''',
+        f'''CREATE TRIGGER section_version_rename AFTER UPDATE OF name ON section BEGIN
+            {bump} WHERE id = new.id;
+        END''',
+        f'''CREATE TRIGGER section_version_insert AFTER INSERT ON section BEGIN
+            {bump} WHERE id = new.id;
+        END''',
+    ):
+        conn.execute(text(trigger))
+
+def current_version(conn):
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def upgrade(engine):
+    # Applies pending migrations one at a time. Each runs in its own write
+    # transaction together with the version bump, so a failed migration leaves
+    # the database at the previous version and two processes starting at once
+    # cannot apply the same step twice. Returns the names of the applied steps.
+    applied = []
+    while True:
+        with engine.begin() as conn:
+            # pysqlite does not start a transaction before DDL by itself
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            version = current_version(conn)
+            if version >= len(MIGRATIONS):
+                break
+            step = MIGRATIONS[version]
+            step(conn)
+            conn.exec_driver_sql(f'PRAGMA user_version = {version + 1}')
+        applied.append(step.__name__)
+
+    return applied
+
+
+# Queries the routes run on every page view, with the index each one must use.
+# `flask db-check-plans` fails if SQLite would answer any of them another way.
+HOT_QUERIES = [
+    ('SELECT * FROM book_issue WHERE user_id = ? AND approved = ?', 'ix_book_issue_user_id_approved'),
+    ('SELECT * FROM book_issue WHERE user_id = ?', 'ix_book_issue_user_id_approved'),
+    ('SELECT * FROM book_issue WHERE book_id = ? AND approved = ?', 'ix_book_issue_book_id_approved'),
+    ('SELECT * FROM book_issue WHERE book_id = ?', 'ix_book_issue_book_id_approved'),
+    ('SELECT * FROM book_issue WHERE approved = ? AND return_date < ?', 'ix_book_issue_approved_return_date'),
+    ('SELECT * FROM book_request WHERE user_id = ? AND status = ?', 'ix_book_request_user_id_status'),
+    ('SELECT * FROM book_request WHERE user_id = ?', 'ix_book_request_user_id_status'),
+    ('SELECT * FROM book_request WHERE book_id = ?', 'ix_book_request_book_id'),
+    ('SELECT * FROM book WHERE name = ?', 'ix_book_name'),
+    ('SELECT * FROM book WHERE section_id = ?', 'ix_book_section_id'),
+    ('SELECT * FROM section WHERE name = ?', 'ix_section_name'),
+]
+
+
+def check_query_plans(conn):
+    # Returns (query, expected index, plan) for every hot query that does not use its index
+    failures = []
+    for query, index in HOT_QUERIES:
+        params = tuple(None for _ in range(query.count('?')))
+        plan = ' / '.join(row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + query, params))
+        if f'INDEX {index} ' not in plan + ' ':
+            failures.append((query, index, plan))
+    return failures
+
+
+@click.command('db-upgrade') # flask db-upgrade: bring the database schema up to date
+@with_appcontext
+def db_upgrade_command():
+    from models import db
+
+    applied = upgrade(db.engine)
+    for name in applied:
+        click.echo(f'Applied {name}')
+    with db.engine.connect() as conn:
+        click.echo(f'Schema is at version {current_version(conn)}')
+
+
+def init_db():
+    # Creates or upgrades the schema and adds the default admin if there is no
+    # admin yet. Returns the names of the migrations applied.
+    from models import db, User
+
+    applied = upgrade(db.engine)
+    if not User.query.filter_by(is_admin=True).first():
+        create_admin('admin', '1111', 'Admin')
+    return applied
+
+
+def create_admin(username, password, name):
+    from models import db, User
+
+    admin = User(username=username, password=password, name=name, is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    return admin
+
+
+@click.command('init-db') # flask init-db: create or upgrade the schema and add the default admin
+@with_appcontext
+def init_db_command():
+    from models import db
+
+    for name in init_db():
+        click.echo(f'Applied {name}')
+    with db.engine.connect() as conn:
+        click.echo(f'Schema is at version {current_version(conn)}')
+
+
+@click.command('create-admin') # flask create-admin USERNAME: add another admin account
+@click.argument('username')
+@click.option('--name', default='Admin', show_default=True)
+@click.password_option()
+@with_appcontext
+def create_admin_command(username, name, password):
+    from models import User
+
+    if User.query.filter_by(username=username).first():
+        raise click.BadParameter(f'{username} already exists', param_hint='USERNAME')
+    create_admin(username, password, name)
+    click.echo(f'Created admin {username}')
+
+
+@click.command('db-check-plans') # flask db-check-plans: fail if a hot query stops using its index
+@with_appcontext
+def db_check_plans_command():
+    from models import db
+
+    with db.engine.connect() as conn:
+        failures = check_query_plans(conn)
+    for query, index, plan in failures:
+        click.echo(f'{query}\n  expected {index}, got: {plan}', err=True)
+    if failures:
+        sys.exit(1)
+    click.echo(f'All {len(HOT_QUERIES)} hot queries use their indexes')
+
+
+def init_app(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(create_admin_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_check_plans_command)
@@ -1,79 +1,181 @@
-from app import app
-
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
-from datetime import datetime
-
-
-
-
-
-app.app_context().push()
-
-db = SQLAlchemy(app)
-
-
-
-# Defining SQLAlchemy models for  database schema
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(255), nullable=False, unique=True)
-    password = db.Column(db.String(255), nullable=False)
-    name = db.Column(db.String(50), nullable=False)
-    is_admin = db.Column(db.Boolean, nullable=False, default=False)
-
-class Section(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column (db.String(255), nullable=False)
-    date_created = db.Column(db.Date, nullable=False)
-    description = db.Column(db.Text)
-
-class Book(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    section_id = db.Column(db.Integer, db.ForeignKey('section.id'), nullable=False)
-    name = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    authors = db.Column(db.String(255), nullable=False)
-    date_added = db.Column(db.Date)
-    price = db.Column(db.Integer, nullable=False)
-    
-    section = db.relationship('Section', backref='books')
-
-
-
-class BookRequest(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_name = db.Column(db.String(255), db.ForeignKey('user.username'),nullable=False)
-    book_name = db.Column(db.String(255), db.ForeignKey('book.name'), nullable=False)
-    request_date = db.Column(db.Date)
-    return_date = db.Column(db.Date)
-    status = db.Column(db.String(255), default='pending', nullable=False)
-    user = db.relationship('User', backref='book_requests')
-    book = db.relationship('Book', backref='book_requests')
-
-class BookIssue(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_name = db.Column(db.String(255), db.ForeignKey('user.username'), nullable=False)
-    book_name = db.Column(db.String(255), db.ForeignKey('book.name'), nullable=False)
-    book_author = db.Column(db.String(255), db.ForeignKey('book.authors'), nullable=False)
-    issue_date = db.Column(db.Date, db.ForeignKey('book_request.request_date'), nullable=False)
-    return_date = db.Column(db.Date, db.ForeignKey('book_request.return_date'))
-    approved = db.Column(db.String(255),db.ForeignKey('book_request.status'), nullable=False)
-    read = db.Column(db.String(255), db.ForeignKey('book.content'))
-    feedback = db.Column(db.String(255), nullable=True)
-
-
-    
-    
-with app.app_context():
-    db.create_all()
-
-    admin = User.query.filter_by(is_admin=True).first()
-    if not admin:
-        password_hash = 1111
-        admin = User(username='admin', password=password_hash, name='Admin', is_admin=True)
-        db.session.add(admin)
-        db.session.commit()
-
-
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.security import generate_password_hash, check_password_hash
+from functools import wraps
+from datetime import datetime
+import hashlib
+
+
+
+
+
+from engines import RoutingSession
+
+# Bound to the app by create_app()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+
+# Defining SQLAlchemy models for  database schema
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(255), nullable=False, unique=True)
+    password = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
+
+class Section(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column (db.String(255), nullable=False, index=True)
+    date_created = db.Column(db.Date, nullable=False)
+    description = db.Column(db.Text)
+    # Maintained by triggers, see migrations.add_library_stats
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+    # Set from a library-wide counter by triggers when the section's cards change,
+    # see migrations.use_global_section_versions
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class BookContent(db.Model):
+    # Book texts, stored once per distinct text and addressed by its SHA-256.
+    # Books and accepted loans point here, so catalog queries never load a text
+    # and loans no longer copy it.
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, unique=True)
+    body = db.Column(db.Text, nullable=False)
+
+    @classmethod
+    def for_text(cls, body):
+        # Returns the stored text with this body, adding it if it is new
+        digest = hashlib.sha256(body.encode()).hexdigest()
+        stored = cls.query.filter_by(sha256=digest).first()
+        if stored is None:
+            stored = cls(sha256=digest, body=body)
+            db.session.add(stored)
+        return stored
+
+class Book(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    section_id = db.Column(db.Integer, db.ForeignKey('section.id'), nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False, index=True)
+    content_id = db.Column(db.Integer, db.ForeignKey('book_content.id'), nullable=False, index=True)
+    authors = db.Column(db.String(255), nullable=False)
+    date_added = db.Column(db.Date)
+    price = db.Column(db.Integer, nullable=False)
+    # Number of accepted issues of this book, maintained by triggers
+    times_issued = db.Column(db.Integer, nullable=False, default=0, index=True)
+    
+    section = db.relationship('Section', backref='books')
+    stored_content = db.relationship('BookContent')
+
+    @property
+    def content(self):
+        # The text is only loaded from book_content when something reads it
+        return self.stored_content.body
+
+
+
+class BookRequest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    # Display copies of the username and book name; a trigger renames them with the book (see migrations.use_integer_keys)
+    user_name = db.Column(db.String(255), nullable=False)
+    book_name = db.Column(db.String(255), nullable=False)
+    request_date = db.Column(db.Date)
+    return_date = db.Column(db.Date)
+    status = db.Column(db.String(255), default='pending', nullable=False)
+    user = db.relationship('User', backref='book_requests')
+    book = db.relationship('Book', backref='book_requests')
+
+    __table_args__ = (
+        db.Index('ix_book_request_user_id_status', 'user_id', 'status'),
+        db.Index('ix_book_request_book_id', 'book_id'),
+    )
+
+class BookIssue(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # NULL only for loans of books renamed before book ids were recorded
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'))
+    # Display copies, renamed with the book like BookRequest's
+    user_name = db.Column(db.String(255), nullable=False)
+    book_name = db.Column(db.String(255), nullable=False)
+    book_author = db.Column(db.String(255), nullable=False)
+    issue_date = db.Column(db.Date, nullable=False)
+    return_date = db.Column(db.Date)
+    approved = db.Column(db.String(255), nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('book_content.id'), index=True)
+    feedback = db.Column(db.String(255), nullable=True)
+    # The return date the loan was issued with; return_date moves to the day it
+    # ends when it is returned or revoked (see fines.py)
+    due_date = db.Column(db.Date)
+
+    # Indexes are created by migrations.py; they are declared here so the models match the schema
+    __table_args__ = (
+        db.Index('ix_book_issue_approved_return_date', 'approved', 'return_date'),
+        db.Index('ix_book_issue_user_id_approved', 'user_id', 'approved'),
+        db.Index('ix_book_issue_book_id_approved', 'book_id', 'approved'),
+    )
+
+
+class LibraryStat(db.Model):
+    # Library-wide running totals (users, sections, books, active_issues,
+    # pending_requests) kept up to date by triggers, see stats.py
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ActivityLog(db.Model):
+    # Loan and request events not yet added to the daily rollups, written by
+    # triggers and emptied by the rollup job, see rollups.py
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    section_id = db.Column(db.Integer, nullable=False)
+    issues = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    revocations = db.Column(db.Integer, nullable=False, default=0)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookDaily(db.Model):
+    # Loan and request events per book and day. Kept after the book is deleted,
+    # under the section it was in at the time.
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+    section_id = db.Column(db.Integer, nullable=False)
+    issues = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    revocations = db.Column(db.Integer, nullable=False, default=0)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+class SectionDaily(db.Model):
+    # The same events per section and day
+    day = db.Column(db.Date, primary_key=True)
+    section_id = db.Column(db.Integer, primary_key=True)
+    issues = db.Column(db.Integer, nullable=False, default=0)
+    returns = db.Column(db.Integer, nullable=False, default=0)
+    revocations = db.Column(db.Integer, nullable=False, default=0)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+class FineLedger(db.Model):
+    # Fines charged for overdue loans (kind 'fine', positive) and payments
+    # (kind 'payment', negative), see fines.py
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Not a foreign key: the entry outlives the loan when its book is deleted
+    loan_id = db.Column(db.Integer, index=True)
+    posted_on = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+
+
+class FineBalance(db.Model):
+    # Sum of each reader's ledger entries, kept by a trigger
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    balance = db.Column(db.Integer, nullable=False, default=0, index=True)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from flask import current_app
+from models import db, Book, BookContent
+
+
+# Server-side PDF downloads.
+#
+# A book's PDF is rendered once with reportlab and cached on disk under
+# PDF_CACHE_DIR, named after a hash of everything that goes into it (the title
+# and the SHA-256 of the text). The same hash is the file's ETag. Downloads are
+# then plain file responses with Range and conditional request support, and a
+# PDF is only rendered again when edit_book_post changes the book.
+
+def pdf_key(name, content_sha256):
+    return hashlib.sha256(f'{name}\0{content_sha256}'.encode()).hexdigest()
+
+
+def pdf_path(key):
+    return os.path.join(current_app.config['PDF_CACHE_DIR'], f'{key}.pdf')
+
+
+def render_pdf(title, body, path):
+    # reportlab takes longer to import than the rest of the app, and only
+    # cache misses need it
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    styles = getSampleStyleSheet()
+    story = [Paragraph(escape(title), styles['Title']), Spacer(1, 12)]
+    for paragraph in body.replace('\r\n', '\n').split('\n\n'):
+        if paragraph.strip():
+            story.append(Paragraph(escape(paragraph).replace('\n', '<br/>'), styles['BodyText']))
+            story.append(Spacer(1, 6))
+
+    # Render next to the final file and move it into place, so a concurrent
+    # download never sees a half written PDF
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        SimpleDocTemplate(tmp_path, pagesize=A4, title=title).build(story)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def book_pdf_key(book):
+    content_sha256 = db.session.query(BookContent.sha256).filter_by(id=book.content_id).scalar()
+    return pdf_key(book.name, content_sha256)
+
+
+def section_pdf_keys(section_id):
+    rows = (db.session.query(Book.name, BookContent.sha256)
+            .join(BookContent, BookContent.id == Book.content_id)
+            .filter(Book.section_id == section_id))
+    return [pdf_key(name, content_sha256) for name, content_sha256 in rows]
+
+
+def book_pdf(book):
+    # Returns (path, key) of the book's PDF, rendering it on the first download
+    key = book_pdf_key(book)
+    path = pdf_path(key)
+    if not os.path.exists(path):
+        render_pdf(book.name, book.content, path)
+    return path, key
+
+
+def discard_pdf(key):
+    # Removes a cached PDF once the book it was rendered from has changed or gone
+    try:
+        os.remove(pdf_path(key))
+    except FileNotFoundError:
+        pass
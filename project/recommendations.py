@@ -0,0 +1,252 @@
+import importlib.util
+import itertools
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+
+from caching import register_scope
+from models import db
+
+
+# "Readers also borrowed" recommendations (optional: needs numpy and scipy).
+#
+# The index is built from the loan history: a sparse user x book matrix of who
+# borrowed what, multiplied by its transpose a block of books at a time to
+# count, for every pair of books, the readers who borrowed both. Each book
+# keeps its RECOMMEND_NEIGHBORS most similar books by cosine similarity
+# (co-borrowers / sqrt(borrowers of one * borrowers of the other)), so the
+# index stays small and a lookup never touches the database.
+#
+# similar_books() serves a book's neighbours and picks_for() adds up the
+# neighbours of everything a reader has borrowed, leaving out what they have
+# already read. Loans accepted in this process are added to the index as they
+# happen (see loans.py); loans from other processes show up when the index is
+# rebuilt, in a background thread, every RECOMMEND_REBUILD_INTERVAL seconds.
+# Until the first build finishes there are no recommendations.
+#
+# Pages that show recommendations name the 'recommendations' scope in their
+# validators (see caching.py), whose version is the time the current index
+# was built, so a copy cached before a build is not revalidated after it.
+
+BORROWED = "('Accepted', 'Returned', 'Revoked')"
+BLOCK_BOOKS = 4096  # books per block of the co-occurrence product
+
+_index = None
+_building = False
+_replay = []  # loans recorded while a build was running
+_lock = threading.Lock()
+_available = None
+
+
+def load_loans(conn):
+    # (user ids, book ids) of every loan, as two numpy arrays
+    import numpy as np
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f'SELECT user_id, book_id FROM book_issue WHERE book_id IS NOT NULL AND approved IN {BORROWED}')
+        pairs = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64)
+    finally:
+        cursor.close()
+    pairs = pairs.reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class RecommendationIndex:
+    def __init__(self, users, books, neighbors):
+        import numpy as np
+        from scipy import sparse
+
+        shape = (int(users.max()) + 1 if len(users) else 0, int(books.max()) + 1 if len(books) else 0)
+        borrowed = sparse.csr_matrix((np.ones(len(users), dtype=np.int32), (users, books)), shape=shape)
+        borrowed.data[:] = 1  # repeat loans of a book count once
+        self.user_books = borrowed
+        self.borrowers = np.asarray(borrowed.sum(axis=0)).ravel()
+
+        # neighbors[book] holds the ids of its most similar books, best first,
+        # padded with -1; counts[book] the readers who borrowed both
+        self.neighbors = np.full((shape[1], neighbors), -1, dtype=np.int32)
+        self.counts = np.zeros((shape[1], neighbors), dtype=np.int32)
+        book_users = borrowed.T.tocsr()
+        for start in range(0, shape[1], BLOCK_BOOKS):
+            block = (book_users[start:start + BLOCK_BOOKS] @ borrowed).tocsr()
+            rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+            cols, counts = block.indices, block.data
+            other = cols != rows + start
+            rows, cols, counts = rows[other], cols[other], counts[other]
+            scores = counts / np.sqrt(self.borrowers[rows + start] * self.borrowers[cols].astype(np.float64))
+
+            # Best first within each row, then the first `neighbors` of each
+            order = np.lexsort((cols, -scores, rows))
+            rows, cols, counts = rows[order], cols[order], counts[order]
+            rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+            top = rank < neighbors
+            self.neighbors[rows[top] + start, rank[top]] = cols[top]
+            self.counts[rows[top] + start, rank[top]] = counts[top]
+
+        # Loans added since the build
+        self.new_books = {}  # user id -> set of book ids
+        self.new_counts = {}  # book id -> Counter of co-borrowed book ids
+        self.new_borrowers = Counter()
+        self.lock = threading.Lock()
+        self.built_at = time.monotonic()
+        self.built_on = time.time()
+
+    def books_of(self, user_id):
+        books = set()
+        if user_id < self.user_books.shape[0]:
+            start, end = self.user_books.indptr[user_id], self.user_books.indptr[user_id + 1]
+            books.update(self.user_books.indices[start:end].tolist())
+        with self.lock:
+            books.update(self.new_books.get(user_id, ()))
+        return books
+
+    def record(self, user_id, book_id):
+        held = self.books_of(user_id)
+        if book_id in held:
+            return
+        with self.lock:
+            for other in held:
+                self.new_counts.setdefault(book_id, Counter())[other] += 1
+                self.new_counts.setdefault(other, Counter())[book_id] += 1
+            self.new_borrowers[book_id] += 1
+            self.new_books.setdefault(user_id, set()).add(book_id)
+
+    def borrower_counts(self, ids):
+        import numpy as np
+
+        ids = np.asarray(ids, dtype=np.int64)
+        counts = np.zeros(len(ids), dtype=np.float64)
+        known = ids < len(self.borrowers)
+        counts[known] = self.borrowers[ids[known]]
+        with self.lock:
+            if self.new_borrowers:
+                counts += [self.new_borrowers.get(id, 0) for id in ids.tolist()]
+        return counts
+
+    def similar(self, book_id):
+        # (ids, scores) of the book's neighbours, best first
+        import numpy as np
+
+        if book_id < len(self.neighbors):
+            ids, counts = self.neighbors[book_id], self.counts[book_id]
+            ids, counts = ids[ids >= 0].astype(np.int64), counts[ids >= 0].astype(np.float64)
+        else:
+            ids, counts = np.zeros(0, dtype=np.int64), np.zeros(0)
+        with self.lock:
+            new = dict(self.new_counts.get(book_id, {}))
+        if new:
+            merged = Counter(dict(zip(ids.tolist(), counts.tolist())))
+            merged.update(new)
+            ids = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+            counts = np.fromiter(merged.values(), dtype=np.float64, count=len(merged))
+        if not len(ids):
+            return ids, counts
+
+        scores = counts / np.sqrt(self.borrower_counts([book_id])[0] * self.borrower_counts(ids))
+        order = np.lexsort((ids, -scores))
+        return ids[order], scores[order]
+
+    def picks(self, user_id):
+        # (ids, scores) of books similar to what the reader borrowed, best first
+        import numpy as np
+
+        held = self.books_of(user_id)
+        similar = [self.similar(book_id) for book_id in held]
+        if not similar:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        ids, inverse = np.unique(np.concatenate([ids for ids, _ in similar]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([scores for _, scores in similar]), minlength=len(ids))
+        unread = ~np.isin(ids, list(held))
+        ids, scores = ids[unread], scores[unread]
+        order = np.lexsort((ids, -scores))
+        return ids[order], scores[order]
+
+
+def is_available():
+    global _available
+    if _available is None:
+        _available = all(importlib.util.find_spec(name) for name in ('numpy', 'scipy'))
+        if not _available:
+            current_app.logger.warning('numpy and scipy are not installed, recommendations are disabled')
+    return _available
+
+
+def build_index():
+    # Builds a new index from the database and makes it the current one
+    global _index, _replay
+    with db.engine.connect() as conn:
+        users, books = load_loans(conn)
+    index = RecommendationIndex(users, books, current_app.config['RECOMMEND_NEIGHBORS'])
+    with _lock:
+        for user_id, book_id in _replay:
+            index.record(user_id, book_id)
+        _replay = []
+        _index = index
+    return index
+
+
+def _build_in_background(app):
+    global _building
+    try:
+        with app.app_context():
+            build_index()
+    except Exception:
+        app.logger.exception('Building the recommendation index failed')
+    finally:
+        _building = False
+
+
+def current_index():
+    # The index, or None before the first build. Starts a build in the
+    # background when there is none yet or the current one is too old.
+    global _building
+    index = _index
+    stale = index is None or time.monotonic() - index.built_at > current_app.config['RECOMMEND_REBUILD_INTERVAL']
+    if stale and not _building and is_available():
+        with _lock:
+            if not _building:
+                _building = True
+                app = current_app._get_current_object()
+                threading.Thread(target=_build_in_background, args=(app,), name='recommendations', daemon=True).start()
+    return index
+
+
+def index_state():
+    # (version, Unix time) of the index for HTTP validators, (0, 0) before the first build
+    index = current_index()
+    if index is None:
+        return 0, 0
+    return int(index.built_on * 1000), int(index.built_on)
+
+
+register_scope('recommendations', index_state)
+
+
+def record_loans(loans):
+    # Adds new (user id, book id) loans to the index
+    with _lock:
+        if _building:
+            _replay.extend(loans)
+        index = _index
+    if index is not None:
+        for user_id, book_id in loans:
+            index.record(user_id, book_id)
+
+
+def similar_books(book_id, limit):
+    # Ids of the books most often borrowed by the readers of this one
+    index = current_index()
+    if index is None:
+        return []
+    return index.similar(book_id)[0][:limit].tolist()
+
+
+def picks_for(user_id, limit):
+    # Ids of the books recommended to a reader
+    index = current_index()
+    if index is None:
+        return []
+    return index.picks(user_id)[0][:limit].tolist()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from metrics import ROLLUP_SECONDS, ROLLUP_EVENTS
+from models import db
+
+
+# Daily rollups of loans and requests, behind the dashboard's trends.
+#
+# Triggers append every issue, return, revocation and request to activity_log
+# as it happens (migrations.add_daily_rollups), which costs the write one small
+# insert. roll_up() adds the log to the per-book and per-section daily totals
+# in book_daily and section_daily and empties it, in one write transaction,
+# so an event is counted exactly once however often it runs. It runs every
+# ROLLUP_INTERVAL seconds in a background thread, or from cron with
+# "flask rollup". The trend queries in stats.py read the rollups together with
+# whatever the log holds, so they are exact between runs too.
+
+COUNTS = ('issues', 'returns', 'revocations', 'requests')
+
+_sums = ', '.join(f'sum({name})' for name in COUNTS)
+_added = ', '.join(f'{name} = {name} + excluded.{name}' for name in COUNTS)
+
+_ROLL_UP = [
+    text(f'''
+        INSERT INTO book_daily (day, book_id, section_id, {', '.join(COUNTS)})
+        SELECT day, book_id, max(section_id), {_sums} FROM activity_log
+        GROUP BY day, book_id
+        ON CONFLICT (day, book_id) DO UPDATE SET {_added}'''),
+    text(f'''
+        INSERT INTO section_daily (day, section_id, {', '.join(COUNTS)})
+        SELECT day, section_id, {_sums} FROM activity_log
+        GROUP BY day, section_id
+        ON CONFLICT (day, section_id) DO UPDATE SET {_added}'''),
+]
+
+
+def roll_up():
+    # Adds the logged events to the daily rollups. Returns the number of events.
+    start = time.perf_counter()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        for statement in _ROLL_UP:
+            conn.execute(statement)
+        events = conn.exec_driver_sql('DELETE FROM activity_log').rowcount
+    ROLLUP_SECONDS.observe(time.perf_counter() - start)
+    ROLLUP_EVENTS.inc(events)
+    return events
+
+
+def _run_rollups(app, interval):
+    while True:
+        try:
+            with app.app_context():
+                roll_up()
+        except Exception:
+            app.logger.exception('Rollup failed')
+        time.sleep(interval)
+
+
+def start_rollups(app, interval=None):
+    if interval is None:
+        interval = app.config['ROLLUP_INTERVAL']
+    thread = threading.Thread(target=_run_rollups, args=(app, interval), name='rollups', daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command('rollup') # flask rollup: add the events logged since the last run to the daily rollups, e.g. from cron
+@with_appcontext
+def rollup_command():
+    events = roll_up()
+    click.echo(f'Rolled up {events} event(s)')
+
+
+def init_app(app):
+    app.cli.add_command(rollup_command)
@@ -0,0 +1,59 @@
+import re
+
+from sqlalchemy import text
+
+from flask import current_app
+from models import db, Book
+
+
+# Full-text catalog search over the book_fts index (see migrations.py).
+#
+# The search form's `params` choice restricts the match to one column of the
+# index; without it all of them are searched. Hits are ordered by BM25 rank.
+
+SEARCH_COLUMNS = {
+    'book_name': 'name',
+    'author_name': 'authors',
+    'section_name': 'section_name',
+}
+
+
+def match_expression(query, params=None):
+    # Turns free text into an FTS5 query: every word must match as a prefix,
+    # e.g. "great gats" -> name : ("great"* "gats"*)
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"*' for word in words)
+    column = SEARCH_COLUMNS.get(params)
+    if column:
+        return f'{column} : ({terms})'
+    return terms
+
+
+def search_book_ids(query, params=None, offset=0, limit=None, conn=None):
+    # Returns (book ids, has_more) for `limit` ranked hits after the first `offset`.
+    # conn is a connection to use instead of db.session (see asgi.py).
+    if limit is None:
+        limit = current_app.config['SEARCH_PAGE_SIZE']
+    expression = match_expression(query, params)
+    if expression is None:
+        return [], False
+
+    rows = (conn or db.session).execute(
+        text('SELECT rowid FROM book_fts WHERE book_fts MATCH :expression ORDER BY rank LIMIT :limit OFFSET :offset'),
+        {'expression': expression, 'limit': limit + 1, 'offset': offset},
+    ).scalars().all()
+    return rows[:limit], len(rows) > limit
+
+
+def search_books(query, params=None, page=1, per_page=None):
+    # Returns (books, has_more) for one page of ranked hits
+    if per_page is None:
+        per_page = current_app.config['SEARCH_PAGE_SIZE']
+    ids, has_more = search_book_ids(query, params, (page - 1) * per_page, per_page)
+    if not ids:
+        return [], has_more
+
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(ids))}
+    return [books[id] for id in ids if id in books], has_more
@@ -0,0 +1,152 @@
+from datetime import date, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from models import db, Section, Book, LibraryStat
+
+
+# Dashboard statistics.
+#
+# The counters are maintained by SQLite triggers (migrations.add_library_stats)
+# in the same transaction as the change that moves them, so reading them is a
+# handful of single-row lookups. rebuild_stats() recounts everything from
+# scratch in case they ever drift, e.g. after editing the database by hand
+# with triggers disabled.
+#
+# The trends (top books, activity over time and per section within a date
+# window) are read from the daily rollups, see rollups.py, so their cost
+# depends on the length of the window and not of the loan history.
+
+def library_stats():
+    # {'users': n, 'sections': n, 'books': n, 'active_issues': n, 'pending_requests': n}
+    return dict(db.session.query(LibraryStat.name, LibraryStat.value).all())
+
+
+def books_per_section():
+    rows = (db.session.query(Section.name, Section.book_count)
+            .filter(Section.book_count > 0)
+            .order_by(Section.id)
+            .all())
+    return [{'section_name': name, 'book_count': count} for name, count in rows]
+
+
+def top_books(limit=5):
+    # Most issued books, read backwards off the ix_book_times_issued index
+    return (db.session.query(Book.name, Book.times_issued)
+            .filter(Book.times_issued > 0)
+            .order_by(Book.times_issued.desc())
+            .limit(limit)
+            .all())
+
+
+
+TREND_WINDOWS = (7, 30, 365)  # days offered by the dashboard
+DEFAULT_TREND_WINDOW = 30
+MAX_TREND_DAYS = max(TREND_WINDOWS)  # longer custom windows are cut to their last MAX_TREND_DAYS days
+MAX_DAILY_POINTS = 366  # longer windows are charted by month
+
+# Rollups for the window plus the events not rolled up yet
+_BOOK_EVENTS = '''(
+    SELECT book_id, issues FROM book_daily WHERE day BETWEEN :start AND :end
+    UNION ALL
+    SELECT book_id, issues FROM activity_log WHERE day BETWEEN :start AND :end
+)'''
+_SECTION_EVENTS = '''(
+    SELECT day, section_id, issues, returns, revocations, requests FROM section_daily WHERE day BETWEEN :start AND :end
+    UNION ALL
+    SELECT day, section_id, issues, returns, revocations, requests FROM activity_log WHERE day BETWEEN :start AND :end
+)'''
+
+
+def trend_window(args):
+    # (start, end, days) from ?start=&end= dates, else the last ?days= days up
+    # to today (days is None for a custom window). Raises ValueError on a bad
+    # custom window: malformed dates, start after end or end after today.
+    today = date.today()
+    if args.get('start') or args.get('end'):
+        start, end = date.fromisoformat(args.get('start', '')), date.fromisoformat(args.get('end', ''))
+        if start > end or end > today:
+            raise ValueError(f'{start} to {end} is not a window up to {today}')
+        return max(start, end - timedelta(days=MAX_TREND_DAYS - 1)), end, None
+    days = args.get('days', DEFAULT_TREND_WINDOW, type=int)
+    if days not in TREND_WINDOWS:
+        days = DEFAULT_TREND_WINDOW
+    return today - timedelta(days=days - 1), today, days
+
+
+def _window(start, end):
+    return {'start': start.isoformat(), 'end': end.isoformat()}
+
+
+def trending_books(start, end, limit=5):
+    # (name, issues) of the books issued most often between the two dates
+    return db.session.execute(text(f'''
+        SELECT book.name, top.total FROM (
+            SELECT book_id, sum(issues) AS total FROM {_BOOK_EVENTS}
+            GROUP BY book_id HAVING total > 0 AND EXISTS (SELECT 1 FROM book WHERE id = book_id)
+            ORDER BY total DESC, book_id LIMIT :limit
+        ) AS top JOIN book ON book.id = top.book_id
+        ORDER BY top.total DESC, top.book_id'''), {**_window(start, end), 'limit': limit}).all()
+
+
+def activity_series(start, end):
+    # Issues, returns, revocations and requests per day between the two dates,
+    # or per month for long windows, with empty periods as zeros
+    monthly = (end - start).days >= MAX_DAILY_POINTS
+    period = 'substr(day, 1, 7)' if monthly else 'day'
+    rows = db.session.execute(text(f'''
+        SELECT {period} AS period, sum(issues), sum(returns), sum(revocations), sum(requests)
+        FROM {_SECTION_EVENTS} GROUP BY period'''), _window(start, end)).all()
+    totals = {row[0]: row[1:] for row in rows}
+
+    series = []
+    day = start
+    while day <= end:
+        label = day.isoformat()[:7] if monthly else day.isoformat()
+        counts = totals.get(label, (0, 0, 0, 0))
+        series.append({'period': label, 'issues': counts[0], 'returns': counts[1],
+                       'revocations': counts[2], 'requests': counts[3]})
+        day = (day.replace(day=1) + timedelta(days=32)).replace(day=1) if monthly else day + timedelta(days=1)
+    return series
+
+
+def section_activity(start, end):
+    # Events per section between the two dates, most issued first
+    rows = db.session.execute(text(f'''
+        SELECT section.name, sum(issues), sum(returns), sum(revocations), sum(requests)
+        FROM {_SECTION_EVENTS} AS events JOIN section ON section.id = events.section_id
+        GROUP BY events.section_id ORDER BY sum(issues) DESC, section.name'''), _window(start, end)).all()
+    return [{'section_name': name, 'issues': issues, 'returns': returns, 'revocations': revocations,
+             'requests': requests} for name, issues, returns, revocations, requests in rows]
+
+def rebuild_stats():
+    db.session.execute(text('''
+        UPDATE library_stat SET value = CASE name
+            WHEN 'users' THEN (SELECT count(*) FROM user)
+            WHEN 'sections' THEN (SELECT count(*) FROM section)
+            WHEN 'books' THEN (SELECT count(*) FROM book)
+            WHEN 'active_issues' THEN (SELECT count(*) FROM book_issue WHERE approved = 'Accepted')
+            WHEN 'pending_requests' THEN (SELECT count(*) FROM book_request WHERE status = 'pending')
+            ELSE value
+        END'''))
+    db.session.execute(text('UPDATE section SET book_count = (SELECT count(*) FROM book WHERE book.section_id = section.id)'))
+    db.session.execute(text('''
+        UPDATE book SET times_issued = (
+            SELECT count(*) FROM book_issue
+            WHERE book_issue.book_id = book.id AND approved IN ('Accepted', 'Returned', 'Revoked')
+        )'''))
+    db.session.commit()
+
+
+@click.command('stats-rebuild') # flask stats-rebuild: recount the dashboard statistics from scratch
+@with_appcontext
+def stats_rebuild_command():
+    rebuild_stats()
+    for name, value in sorted(library_stats().items()):
+        click.echo(f'{name}: {value}')
+
+
+def init_app(app):
+    app.cli.add_command(stats_rebuild_command)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+
+from metrics import SWEEP_SECONDS, SWEEP_REVOKED
+from models import db, BookIssue
+
+
+# Loans only become overdue when the date changes, so the date of the last
+# completed sweep is all the state we need: once today's sweep has run, every
+# request for the rest of the day can skip it.
+_last_swept = None
+_sweep_lock = threading.Lock()
+
+
+def sweep_overdue():
+    # Revokes every accepted loan more than REVOKE_AFTER_DAYS past its return
+    # date with a single UPDATE served by the (approved, return_date) index.
+    # Until then the loan stays out and accrues a fine (see fines.py). Returns
+    # the number of loans revoked.
+    global _last_swept
+    today = datetime.now().date()
+    overdue_since = today - timedelta(days=current_app.config['REVOKE_AFTER_DAYS'])
+
+    with _sweep_lock:
+        start = time.perf_counter()
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(BookIssue.__table__)
+                .where(BookIssue.approved == 'Accepted', BookIssue.return_date < overdue_since)
+                .values(approved='Revoked', return_date=today)
+            )
+        _last_swept = today
+        SWEEP_SECONDS.observe(time.perf_counter() - start)
+        SWEEP_REVOKED.inc(result.rowcount)
+
+    return result.rowcount
+
+
+def sweep_is_due():
+    return _last_swept != datetime.now().date()
+
+
+def sweep_if_due():
+    # Cheap check run on every request; only sweeps on the first request of a new day
+    # when the background sweeper has not got there first
+    if sweep_is_due():
+        sweep_overdue()
+
+
+def _seconds_until_next_sweep(interval):
+    # Wake up at midnight as well, so loans are revoked as soon as they expire
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, min(interval, (midnight - now).total_seconds()))
+
+
+def _run_sweeper(app, interval):
+    while True:
+        try:
+            with app.app_context():
+                sweep_overdue()
+        except Exception:
+            app.logger.exception('Overdue sweep failed')
+        time.sleep(_seconds_until_next_sweep(interval))
+
+
+def start_sweeper(app, interval=None):
+    if interval is None:
+        interval = app.config['OVERDUE_SWEEP_INTERVAL']
+    thread = threading.Thread(target=_run_sweeper, args=(app, interval), name='overdue-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command('sweep-overdue') # flask sweep-overdue: revoke overdue loans now, e.g. from cron
+@with_appcontext
+def sweep_overdue_command():
+    revoked = sweep_overdue()
+    click.echo(f'Revoked {revoked} overdue loan(s)')
+
+
+def init_app(app):
+    app.cli.add_command(sweep_overdue_command)
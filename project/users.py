@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, g, session
+from sqlalchemy import select
+
+from models import db, User
+
+
+# The logged-in user.
+#
+# current_user() resolves session['user_id'] once per request into flask.g, so
+# the login decorators and the view share one lookup. Behind it sits a small
+# LRU of user snapshots shared by all requests in the process, so most requests
+# run no user query at all. Snapshots hold only what pages display and the
+# decorators check (never the password) and are plain tuples, not ORM objects,
+# so they are safe to share between threads.
+#
+# profile_post and register_post call forget_user() after changing a user.
+# Other processes only see the change once their entry expires, after
+# USER_CACHE_TTL seconds.
+
+CurrentUser = namedtuple('CurrentUser', 'id username name is_admin')
+
+_users = OrderedDict()
+_users_lock = threading.Lock()
+
+
+def load_user(user_id, conn=None):
+    # conn is a connection to use instead of db.session (see asgi.py)
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(user_id)
+        if entry is not None and now - entry[1] < current_app.config['USER_CACHE_TTL']:
+            _users.move_to_end(user_id)
+            return entry[0]
+
+    query = select(User.id, User.username, User.name, User.is_admin).where(User.id == user_id)
+    row = (conn or db.session).execute(query).first()
+    user = CurrentUser(*row) if row else None
+    with _users_lock:
+        _users[user_id] = (user, now)
+        _users.move_to_end(user_id)
+        while len(_users) > current_app.config['USER_CACHE_SIZE']:
+            _users.popitem(last=False)
+    return user
+
+
+def current_user():
+    # The logged-in user as a CurrentUser, or None
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = load_user(user_id) if user_id is not None else None
+    return g.current_user
+
+
+def forget_user(user_id):
+    with _users_lock:
+        _users.pop(user_id, None)
+    g.pop('current_user', None)
+
+
+def reset_current_user():
+    # g outlives the request when the caller already had an app context pushed
+    g.pop('current_user', None)
+
+
+def init_app(app):
+    app.before_request(reset_current_user)